@@ -1,20 +1,62 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, Float, Index
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql import func
+from typing import AsyncIterator
+import hashlib
 import os
 
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./xinference_qa.db")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+# Connection pool configuration (ignored for SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Async drivers used when DATABASE_URL does not name one
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+def _async_database_url(url: str) -> str:
+    """Point a plain database URL at the matching async driver"""
+    scheme, sep, rest = url.partition("://")
+    if "+" in scheme or scheme not in ASYNC_DRIVERS:
+        return url
+    return f"{ASYNC_DRIVERS[scheme]}{sep}{rest}"
+
+ASYNC_DATABASE_URL = _async_database_url(DATABASE_URL)
+
+if ASYNC_DATABASE_URL.startswith("sqlite"):
+    engine = create_async_engine(ASYNC_DATABASE_URL)
+else:
+    engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_pre_ping=True
+    )
+
+# Objects stay usable after commit, attributes are not reloaded lazily in async code
+SessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# SQLite stores server-side timestamps as text without microseconds. Bind
+# parameters use the same format so that keyset comparisons on created_at
+# compare like with like.
+Timestamp = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+    ),
+    "sqlite"
+)
+
 # User model
 class User(Base):
     __tablename__ = "users"
@@ -34,31 +76,49 @@ class QuestionHistory(Base):
     __tablename__ = "question_history"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True)
+    user_id = Column(Integer)
     question = Column(Text, nullable=False)
     answer = Column(Text, nullable=False)
     confidence = Column(String(10))
     response_time = Column(String(20))
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    confidence_score = Column(Float)
+    response_time_seconds = Column(Float)
+    created_at = Column(Timestamp, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_question_history_user_created", "user_id", "created_at"),
+    )
 
 # User favorites model
 class UserFavorite(Base):
     __tablename__ = "user_favorites"
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True)
+    user_id = Column(Integer)
     question = Column(Text, nullable=False)
+    question_hash = Column(String(64), nullable=False)
     answer = Column(Text, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(Timestamp, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_user_favorites_user_created", "user_id", "created_at"),
+        Index("uq_user_favorites_user_question_hash", "user_id", "question_hash", unique=True),
+    )
+
+def hash_question(question: str) -> str:
+    """Fixed-size key of a question, indexable unlike the Text column"""
+    return hashlib.sha256(question.encode("utf-8")).hexdigest()
 
 # Database dependency
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db() -> AsyncIterator[AsyncSession]:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 # Create tables
-def create_tables():
-    Base.metadata.create_all(bind=engine)
+async def create_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+async def close_engine():
+    """Close all pooled connections"""
+    await engine.dispose()
@@ -1,24 +1,34 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, status
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Query, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
-from datetime import timedelta
+from typing import Optional, Dict, Any
+from datetime import datetime, timedelta
+import asyncio
+import base64
+import json
 import uvicorn
 import os
 from dotenv import load_dotenv
-from sqlalchemy.orm import Session
+from sqlalchemy import select, func, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from services.search_service import SearchService
 from services.documentation_service import DocumentationService
 from services.github_service import GitHubService
 from services.response_service import ResponseService
+from services.answer_cache import normalize_question
+from services.single_flight import SingleFlight
+from services.history_writer import HistoryWriter
 from models.schemas import (
     QuestionRequest, AnswerResponse, SearchResult,
     UserCreate, UserLogin, UserResponse, Token, UserStats,
-    QuestionHistoryResponse, UserFavoriteResponse
+    QuestionHistoryPage, UserFavoritePage
 )
-from database import get_db, create_tables, User, QuestionHistory, UserFavorite
+from database import get_db, create_tables, close_engine, hash_question, User, QuestionHistory, UserFavorite
+from migrations import run_migrations
 from auth import (
     authenticate_user, create_access_token, create_user, get_current_active_user,
     get_user_by_username, get_user_by_email, ACCESS_TOKEN_EXPIRE_MINUTES
@@ -48,22 +58,99 @@ github_service = GitHubService()
 search_service = SearchService(doc_service, github_service)
 response_service = ResponseService()
 
-@app.on_event("startup")
-async def startup_event():
-    """Initialize services on startup"""
-    # Create database tables
-    create_tables()
+# Question history is written behind the request in batches
+history_writer = HistoryWriter(
+    batch_size=int(os.getenv("HISTORY_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("HISTORY_FLUSH_INTERVAL_SECONDS", "1"))
+)
+
+# In-flight /api/ask computations, shared by identical concurrent questions
+ask_flight = SingleFlight()
+
+# Cached answers may cite passages that changed, drop them with the old index
+search_service.add_index_listener(response_service.answer_cache.clear)
+
+# Background refresh of the sources and the search index
+INDEX_REFRESH_INTERVAL_HOURS = float(os.getenv("CACHE_DURATION_HOURS", "1"))
+DOC_REFRESH_INTERVAL_HOURS = float(os.getenv("DOC_REFRESH_INTERVAL_HOURS", "24"))
+refresh_task: Optional[asyncio.Task] = None
+
+# Set by run.py in pre-fork mode: the services were loaded by preload_services
+# in the master process and are shared by the forked workers
+services_preloaded = False
+# Only one of the pre-forked workers refreshes the sources
+refresh_enabled = True
+
+async def preload_services():
+    """Prepare the database and load the sources and the search index.
+
+    Runs in the pre-fork master before the workers are forked. Connections
+    opened here belong to this process, they are closed so that the workers
+    open their own.
+    """
+    await create_tables()
+    await run_migrations()
+    await close_engine()
 
-    # Initialize services
     await doc_service.initialize()
     await github_service.initialize()
     await search_service.initialize()
+    await doc_service.close()
+    await github_service.close()
+
+async def reload_services():
+    """Re-read the caches and the index written by the refreshing worker.
+
+    Runs in the pre-fork master after a refresh. Only reads from disk: the
+    master neither syncs nor rebuilds anything.
+    """
+    doc_service.load_cached_pages()
+    github_service.load_cached_issues()
+    await search_service.reload_index()
+
+@app.on_event("startup")
+async def startup_event():
+    """Initialize services on startup"""
+    global refresh_task
+
+    if services_preloaded:
+        doc_service.connect()
+        github_service.connect()
+    else:
+        # Create database tables and bring existing ones up to date
+        await create_tables()
+        await run_migrations()
+
+        # Initialize services
+        await doc_service.initialize()
+        await github_service.initialize()
+        await search_service.initialize()
+
+    await history_writer.start()
+
+    # Keep the index fresh without blocking requests
+    if INDEX_REFRESH_INTERVAL_HOURS > 0 and refresh_enabled:
+        refresh_task = asyncio.create_task(search_service.refresh_periodically(
+            interval=INDEX_REFRESH_INTERVAL_HOURS * 3600,
+            doc_interval=DOC_REFRESH_INTERVAL_HOURS * 3600
+        ))
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup resources on shutdown"""
+    if refresh_task:
+        refresh_task.cancel()
+        try:
+            await refresh_task
+        except asyncio.CancelledError:
+            pass
+
     await response_service.close()
 
+    # Flush queued history before the connections go away
+    await history_writer.stop()
+    await close_engine()
+
 @app.get("/")
 async def root():
     return {"message": "Xinference Q&A Agent API"}
@@ -74,24 +161,24 @@ async def health_check():
 
 # Authentication endpoints
 @app.post("/api/auth/register", response_model=UserResponse)
-async def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     """Register a new user"""
     # Check if username already exists
-    if get_user_by_username(db, user.username):
+    if await get_user_by_username(db, user.username):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered"
         )
 
     # Check if email already exists
-    if get_user_by_email(db, user.email):
+    if await get_user_by_email(db, user.email):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
 
     # Create new user
-    db_user = create_user(
+    db_user = await create_user(
         db=db,
         username=user.username,
         email=user.email,
@@ -102,9 +189,9 @@ async def register(user: UserCreate, db: Session = Depends(get_db)):
     return db_user
 
 @app.post("/api/auth/login", response_model=Token)
-async def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
+async def login(user_credentials: UserLogin, db: AsyncSession = Depends(get_db)):
     """Login user and return access token"""
-    user = authenticate_user(db, user_credentials.username, user_credentials.password)
+    user = await authenticate_user(db, user_credentials.username, user_credentials.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -129,7 +216,7 @@ async def get_current_user_info(current_user: User = Depends(get_current_active_
     return current_user
 
 async def get_optional_current_user(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     credentials: Optional[str] = None
 ) -> Optional[User]:
     """Get current user if authenticated, otherwise return None"""
@@ -142,42 +229,57 @@ async def get_optional_current_user(
     except:
         return None
 
+async def _search_and_answer(request: QuestionRequest):
+    """Retrieve the sources for a question and generate the answer"""
+    # Search the requested sources
+    search_results = await search_service.search(
+        query=request.question,
+        max_results=request.max_results or 10,
+        include_sources=request.include_sources
+    )
+
+    print(f"Found {len(search_results)} search results for: {request.question}")
+
+    # Generate response using AI
+    answer = await response_service.generate_answer(
+        question=request.question,
+        search_results=search_results,
+        context=request.context
+    )
+
+    return search_results, answer
+
 @app.post("/api/ask", response_model=AnswerResponse)
 async def ask_question(
     request: QuestionRequest,
-    db: Session = Depends(get_db),
     current_user: Optional[User] = Depends(get_optional_current_user)
 ):
     """
     Main endpoint to ask questions about Xinference
     """
     try:
-        # Search across all sources
-        search_results = await search_service.search_all_sources(
-            query=request.question,
-            max_results=request.max_results or 10
+        # Identical questions asked concurrently share one search and one completion
+        flight_key = (
+            normalize_question(request.question),
+            request.max_results or 10,
+            request.context or "",
+            tuple(sorted(source.value for source in request.include_sources))
         )
-
-        print(f"Found {len(search_results)} search results for: {request.question}")
-
-        # Generate response using AI
-        answer = await response_service.generate_answer(
-            question=request.question,
-            search_results=search_results,
-            context=request.context
+        search_results, answer = await ask_flight.do(
+            flight_key,
+            lambda: _search_and_answer(request)
         )
 
         # Save to user history if authenticated
         if current_user:
-            history_entry = QuestionHistory(
+            # Written in the background, the answer does not wait for the commit
+            history_writer.record(
                 user_id=current_user.id,
                 question=request.question,
                 answer=answer.content,
-                confidence=str(answer.confidence),
-                response_time=str(answer.response_time)
+                confidence=answer.confidence,
+                response_time=answer.response_time
             )
-            db.add(history_entry)
-            db.commit()
 
         return AnswerResponse(
             question=request.question,
@@ -191,6 +293,48 @@ async def ask_question(
         print(f"Error in ask_question: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/ask/stream")
+async def ask_question_stream(request: QuestionRequest):
+    """
+    Ask a question and receive the answer as Server-Sent Events.
+
+    The search sources are sent first as a `sources` event, followed by
+    `token` events while the answer is generated and a final `done` event.
+    """
+    async def event_stream():
+        try:
+            search_results = await search_service.search(
+                query=request.question,
+                max_results=request.max_results or 10,
+                include_sources=request.include_sources
+            )
+
+            yield _sse_event("sources", [result.dict() for result in search_results])
+
+            async for event in response_service.stream_answer(
+                question=request.question,
+                search_results=search_results,
+                context=request.context
+            ):
+                yield _sse_event(event.pop("type"), event)
+
+        except Exception as e:
+            print(f"Error in ask_question_stream: {e}")
+            yield _sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Keep nginx from buffering the stream
+        }
+    )
+
 @app.get("/api/search/documentation")
 async def search_documentation(q: str, limit: int = 5):
     """Search Xinference documentation"""
@@ -234,71 +378,122 @@ async def get_popular_questions():
         raise HTTPException(status_code=500, detail=str(e))
 
 # User-specific endpoints
-@app.get("/api/user/history", response_model=List[QuestionHistoryResponse])
+def _encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Opaque cursor pointing just after a row in (created_at, id) order"""
+    raw = json.dumps([created_at.isoformat(), row_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+async def _keyset_page(db: AsyncSession, model, user_id: int, limit: int, cursor: Optional[str]):
+    """Fetch one page of a user's rows, newest first, starting after the cursor.
+
+    The filter on (user_id, created_at, id) is served by the composite index
+    however deep the client pages.
+    """
+    query = select(model).where(model.user_id == user_id)
+
+    if cursor:
+        created_at, row_id = _decode_cursor(cursor)
+        query = query.where(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id)
+        ))
+
+    # One extra row tells whether there is a next page
+    result = await db.execute(
+        query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+    )
+    rows = result.scalars().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    return {"items": rows, "next_cursor": next_cursor}
+
+@app.get("/api/user/history", response_model=QuestionHistoryPage)
 async def get_user_history(
-    limit: int = 20,
-    db: Session = Depends(get_db),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Get user's question history"""
-    history = db.query(QuestionHistory).filter(
-        QuestionHistory.user_id == current_user.id
-    ).order_by(QuestionHistory.created_at.desc()).limit(limit).all()
+    """Get user's question history, one page at a time"""
+    return await _keyset_page(db, QuestionHistory, current_user.id, limit, cursor)
 
-    return history
-
-@app.get("/api/user/favorites", response_model=List[UserFavoriteResponse])
+@app.get("/api/user/favorites", response_model=UserFavoritePage)
 async def get_user_favorites(
-    db: Session = Depends(get_db),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Get user's favorite questions"""
-    favorites = db.query(UserFavorite).filter(
-        UserFavorite.user_id == current_user.id
-    ).order_by(UserFavorite.created_at.desc()).all()
-
-    return favorites
+    """Get user's favorite questions, one page at a time"""
+    return await _keyset_page(db, UserFavorite, current_user.id, limit, cursor)
 
 @app.post("/api/user/favorites")
 async def add_to_favorites(
     request: Dict[str, str],
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Add a question to user's favorites"""
-    # Check if already in favorites
-    existing = db.query(UserFavorite).filter(
-        UserFavorite.user_id == current_user.id,
-        UserFavorite.question == request["question"]
-    ).first()
+    question_hash = hash_question(request["question"])
+    already_favorited = HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Question already in favorites"
+    )
 
-    if existing:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Question already in favorites"
+    # Check if already in favorites
+    result = await db.execute(
+        select(UserFavorite.id).where(
+            UserFavorite.user_id == current_user.id,
+            UserFavorite.question_hash == question_hash
         )
+    )
+    if result.first():
+        raise already_favorited
 
     favorite = UserFavorite(
         user_id=current_user.id,
         question=request["question"],
+        question_hash=question_hash,
         answer=request["answer"]
     )
     db.add(favorite)
-    db.commit()
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Lost a race with a concurrent request adding the same question
+        await db.rollback()
+        raise already_favorited
 
     return {"message": "Added to favorites"}
 
 @app.delete("/api/user/favorites/{favorite_id}")
 async def remove_from_favorites(
     favorite_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Remove a question from user's favorites"""
-    favorite = db.query(UserFavorite).filter(
-        UserFavorite.id == favorite_id,
-        UserFavorite.user_id == current_user.id
-    ).first()
+    result = await db.execute(
+        select(UserFavorite).where(
+            UserFavorite.id == favorite_id,
+            UserFavorite.user_id == current_user.id
+        )
+    )
+    favorite = result.scalars().first()
 
     if not favorite:
         raise HTTPException(
@@ -306,46 +501,46 @@ async def remove_from_favorites(
             detail="Favorite not found"
         )
 
-    db.delete(favorite)
-    db.commit()
+    await db.delete(favorite)
+    await db.commit()
 
     return {"message": "Removed from favorites"}
 
 @app.get("/api/user/stats", response_model=UserStats)
 async def get_user_stats(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
     """Get user statistics"""
-    # Get total questions
-    total_questions = db.query(QuestionHistory).filter(
-        QuestionHistory.user_id == current_user.id
-    ).count()
-
-    # Get total favorites
-    total_favorites = db.query(UserFavorite).filter(
-        UserFavorite.user_id == current_user.id
-    ).count()
-
-    # Calculate average confidence
-    history_records = db.query(QuestionHistory).filter(
-        QuestionHistory.user_id == current_user.id
-    ).all()
-
-    avg_confidence = 0.0
-    if history_records:
-        confidences = [float(record.confidence) for record in history_records if record.confidence]
-        avg_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    # Totals and average confidence in a single aggregate query
+    total_favorites = (
+        select(func.count())
+        .select_from(UserFavorite)
+        .where(UserFavorite.user_id == current_user.id)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        select(
+            func.count(QuestionHistory.id),
+            func.avg(QuestionHistory.confidence_score),
+            total_favorites
+        ).where(QuestionHistory.user_id == current_user.id)
+    )
+    total_questions, avg_confidence, total_favorites = result.one()
 
     # Get recent activity
-    recent_activity = db.query(QuestionHistory).filter(
-        QuestionHistory.user_id == current_user.id
-    ).order_by(QuestionHistory.created_at.desc()).limit(5).all()
+    result = await db.execute(
+        select(QuestionHistory)
+        .where(QuestionHistory.user_id == current_user.id)
+        .order_by(QuestionHistory.created_at.desc())
+        .limit(5)
+    )
+    recent_activity = result.scalars().all()
 
     return UserStats(
         total_questions=total_questions,
         total_favorites=total_favorites,
-        avg_confidence=avg_confidence,
+        avg_confidence=avg_confidence or 0.0,
         recent_activity=recent_activity
     )
 
@@ -0,0 +1,149 @@
+"""
+Schema migrations for databases created by earlier versions.
+
+`create_tables` only creates missing tables, so changes to existing tables
+are applied here. Each migration runs once and is recorded in the
+`schema_migrations` table. Backfills run in batches, each committed on its
+own, so that a large table is never locked for the whole migration.
+"""
+
+from sqlalchemy import MetaData, Table, inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import DropIndex
+
+from database import engine, hash_question
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def _columns(conn: Connection, table: str) -> set:
+    return {column["name"] for column in inspect(conn).get_columns(table)}
+
+
+def _indexes(conn: Connection, table: str) -> set:
+    return {index["name"] for index in inspect(conn).get_indexes(table)}
+
+
+def _add_column(conn: Connection, table: str, column: str, ddl_type: str):
+    if column not in _columns(conn, table):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+def _create_index(conn: Connection, table: str, name: str, columns: str, unique: bool = False):
+    if name not in _indexes(conn, table):
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        conn.execute(text(f"CREATE {kind} {name} ON {table} ({columns})"))
+
+
+def _drop_index(conn: Connection, table: str, name: str):
+    if name not in _indexes(conn, table):
+        return
+    # The statement depends on the dialect (MySQL needs the table), let SQLAlchemy emit it
+    reflected = Table(table, MetaData(), autoload_with=conn)
+    for index in reflected.indexes:
+        if index.name == name:
+            conn.execute(DropIndex(index))
+
+
+def _backfill_history_scores(conn: Connection):
+    """Copy the string confidence and response time into the Float columns"""
+    max_id = conn.execute(text("SELECT MAX(id) FROM question_history")).scalar() or 0
+
+    for start in range(0, max_id + 1, BACKFILL_BATCH_SIZE):
+        conn.execute(
+            text(
+                "UPDATE question_history SET "
+                "confidence_score = CAST(NULLIF(confidence, '') AS FLOAT), "
+                "response_time_seconds = CAST(NULLIF(response_time, '') AS FLOAT) "
+                "WHERE id >= :start AND id < :end AND confidence_score IS NULL"
+            ),
+            {"start": start, "end": start + BACKFILL_BATCH_SIZE}
+        )
+        conn.commit()
+
+
+def _backfill_favorite_hashes(conn: Connection):
+    """Hash the question of every favorite, dropping duplicates of a user's question"""
+    seen = set()
+    last_id = 0
+
+    while True:
+        rows = conn.execute(
+            text(
+                "SELECT id, user_id, question, question_hash FROM user_favorites "
+                "WHERE id > :last_id ORDER BY id LIMIT :limit"
+            ),
+            {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+
+        updates = []
+        duplicates = []
+        for favorite_id, user_id, question, current_hash in rows:
+            question_hash = current_hash or hash_question(question)
+            if (user_id, question_hash) in seen:
+                # The oldest favorite wins, as the unique index would have enforced
+                duplicates.append({"id": favorite_id})
+                continue
+            seen.add((user_id, question_hash))
+            if not current_hash:
+                updates.append({"id": favorite_id, "question_hash": question_hash})
+
+        if updates:
+            conn.execute(
+                text("UPDATE user_favorites SET question_hash = :question_hash WHERE id = :id"),
+                updates
+            )
+        if duplicates:
+            conn.execute(text("DELETE FROM user_favorites WHERE id = :id"), duplicates)
+        conn.commit()
+
+        last_id = rows[-1][0]
+
+
+def _typed_columns_and_composite_indexes(conn: Connection):
+    _add_column(conn, "question_history", "confidence_score", "FLOAT")
+    _add_column(conn, "question_history", "response_time_seconds", "FLOAT")
+    _add_column(conn, "user_favorites", "question_hash", "VARCHAR(64)")
+    conn.commit()
+
+    _backfill_history_scores(conn)
+    _backfill_favorite_hashes(conn)
+
+    # The composite indexes serve the per-user listings, the single-column ones become redundant
+    _create_index(conn, "question_history", "ix_question_history_user_created", "user_id, created_at")
+    _create_index(conn, "user_favorites", "ix_user_favorites_user_created", "user_id, created_at")
+    _create_index(
+        conn, "user_favorites", "uq_user_favorites_user_question_hash",
+        "user_id, question_hash", unique=True
+    )
+    _drop_index(conn, "question_history", "ix_question_history_user_id")
+    _drop_index(conn, "user_favorites", "ix_user_favorites_user_id")
+
+
+# Ordered list of (version, migration), append new migrations at the end
+MIGRATIONS = [
+    (1, _typed_columns_and_composite_indexes),
+]
+
+
+def _migrate(conn: Connection):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY)"))
+    applied = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+    conn.commit()
+
+    for version, migration in MIGRATIONS:
+        if version in applied:
+            continue
+
+        print(f"Applying database migration {version}: {migration.__name__}")
+        migration(conn)
+        conn.execute(text("INSERT INTO schema_migrations (version) VALUES (:version)"), {"version": version})
+        conn.commit()
+
+
+async def run_migrations():
+    """Apply pending migrations"""
+    async with engine.connect() as conn:
+        await conn.run_sync(_migrate)
@@ -56,6 +56,7 @@ class DocumentationPage(BaseModel):
     content: str
     section: str
     last_updated: Optional[datetime] = None
+    sections: List[Dict[str, Any]] = []
 
 class GitHubIssue(BaseModel):
     number: int
@@ -67,6 +68,7 @@ class GitHubIssue(BaseModel):
     created_at: datetime
     updated_at: datetime
     author: str
+    comments: List[str] = []
 
 class CodeSearchResult(BaseModel):
     file_path: str
@@ -127,6 +129,14 @@ class UserFavoriteResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class QuestionHistoryPage(BaseModel):
+    items: List[QuestionHistoryResponse]
+    next_cursor: Optional[str] = None
+
+class UserFavoritePage(BaseModel):
+    items: List[UserFavoriteResponse]
+    next_cursor: Optional[str] = None
+
 class UserStats(BaseModel):
     total_questions: int
     total_favorites: int
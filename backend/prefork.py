@@ -0,0 +1,251 @@
+"""
+Pre-fork serving mode.
+
+The master process binds the listening socket, loads the sources and the
+search index once and freezes them with gc.freeze(), then forks the workers
+that run uvicorn on the inherited socket. The workers share the loaded data
+copy-on-write: frozen objects are never visited by the collector, so their
+pages are not copied by garbage collection passes, and the mapped index is
+shared through the page cache anyway.
+
+The first worker is the only one that refreshes the sources. When it swaps
+in a new index it signals the master (SIGHUP), which re-reads the caches and
+the index from disk and replaces the other workers one at a time.
+"""
+
+import asyncio
+import gc
+import os
+import select
+import signal
+import socket
+import time
+from typing import Dict, Optional
+
+import uvicorn
+
+# Slot of the worker that refreshes the sources
+REFRESH_SLOT = 0
+# Seconds a replacement worker gets to start serving during a rolling restart
+READY_TIMEOUT = 120.0
+# Workers exiting sooner than this after their start are restarted with a growing delay
+MIN_WORKER_UPTIME = 10.0
+MAX_RESPAWN_DELAY = 60.0
+
+
+class PreforkServer:
+    """Master process supervising `workers` forked uvicorn servers"""
+
+    def __init__(self, host: str, port: int, workers: int, log_level: str = "info"):
+        self.host = host
+        self.port = port
+        self.workers = max(workers, 1)
+        self.log_level = log_level
+        self.pid = os.getpid()
+        self.socket = None
+        # pid -> slot of the running workers
+        self.children: Dict[int, int] = {}
+        self.started_at: Dict[int, float] = {}
+        # Replaced workers that are finishing their requests
+        self.retiring = set()
+        # slot -> consecutive early exits, and when the slot may be restarted
+        self.failures: Dict[int, int] = {}
+        self.respawn_at: Dict[int, float] = {}
+        self._reload = False
+        self._stopping = False
+
+    def _bind(self) -> socket.socket:
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def _load(self, loader):
+        """Run a loader of main and move what it loaded out of reach of the collector"""
+        gc.unfreeze()
+        asyncio.run(loader())
+
+        gc.collect()
+        gc.freeze()
+
+    def _spawn(self, slot: int, ready_fd: Optional[int] = None) -> int:
+        pid = os.fork()
+        if pid:
+            self.children[pid] = slot
+            self.started_at[pid] = time.monotonic()
+            return pid
+
+        # Child: serve until uvicorn exits, never return into the master loop
+        status = 1
+        try:
+            self._serve(slot, ready_fd)
+            status = 0
+        except BaseException as e:
+            print(f"Worker {os.getpid()} failed: {e!r}")
+        finally:
+            os._exit(status)
+
+    def _serve(self, slot: int, ready_fd: Optional[int]):
+        import main
+
+        for sig in (signal.SIGHUP, signal.SIGINT, signal.SIGTERM, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+
+        main.refresh_enabled = slot == REFRESH_SLOT
+        if main.refresh_enabled:
+            main.search_service.add_index_listener(lambda: os.kill(self.pid, signal.SIGHUP))
+
+        if ready_fd is not None:
+            # Runs after the application startup, right before uvicorn starts accepting
+            @main.app.on_event("startup")
+            def notify_ready():
+                os.write(ready_fd, b"1")
+                os.close(ready_fd)
+
+        config = uvicorn.Config(main.app, log_level=self.log_level)
+        uvicorn.Server(config).run(sockets=[self.socket])
+
+    def _wait_ready(self, read_fd: int) -> bool:
+        """Whether the worker writing to `read_fd` started serving in time"""
+        deadline = time.monotonic() + READY_TIMEOUT
+        while not self._stopping:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            readable, _, _ = select.select([read_fd], [], [], min(remaining, 0.5))
+            if readable:
+                # Nothing but end of file when the worker died before it was ready
+                return os.read(read_fd, 1) == b"1"
+        return False
+
+    def _handle_reload(self, signum, frame):
+        self._reload = True
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _reap(self):
+        """Collect exited workers and schedule the restart of the ones that were not retired"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+
+            started_at = self.started_at.pop(pid, None)
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                continue
+
+            slot = self.children.pop(pid, None)
+            if slot is None or self._stopping:
+                continue
+
+            # A worker that keeps failing at startup is not restarted in a tight loop
+            if started_at is not None and time.monotonic() - started_at < MIN_WORKER_UPTIME:
+                self.failures[slot] = self.failures.get(slot, 0) + 1
+            else:
+                self.failures[slot] = 0
+            delay = min(2 ** self.failures[slot] - 1, MAX_RESPAWN_DELAY)
+
+            print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, "
+                  f"restarting it in {delay:.0f}s")
+            self.respawn_at[slot] = time.monotonic() + delay
+
+    def _respawn_due(self):
+        now = time.monotonic()
+        for slot, due in list(self.respawn_at.items()):
+            if due <= now:
+                del self.respawn_at[slot]
+                self._spawn(slot)
+
+    def _rolling_restart(self):
+        """Reload the data and replace the serving workers one at a time.
+
+        Each old worker is stopped only once its replacement is serving, so
+        the socket always has workers accepting on it. The refreshing worker
+        already serves the new index and keeps its refresh schedule, it is
+        not replaced.
+        """
+        print("Search index refreshed, reloading workers...")
+        import main
+
+        try:
+            self._load(main.reload_services)
+        except Exception as e:
+            print(f"Error reloading services, keeping the current workers: {e}")
+            return
+
+        for pid, slot in list(self.children.items()):
+            if slot == REFRESH_SLOT or self._stopping or pid not in self.children:
+                continue
+
+            read_fd, write_fd = os.pipe()
+            try:
+                replacement = self._spawn(slot, write_fd)
+                os.close(write_fd)
+                ready = self._wait_ready(read_fd)
+            finally:
+                os.close(read_fd)
+
+            if not ready:
+                print(f"Replacement worker {replacement} did not start, keeping the remaining workers")
+                self.children.pop(replacement, None)
+                self.retiring.add(replacement)
+                try:
+                    os.kill(replacement, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+                return
+
+            del self.children[pid]
+            self.retiring.add(pid)
+            os.kill(pid, signal.SIGTERM)
+
+    def _stop(self):
+        for pid in list(self.children) + list(self.retiring):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        while self.children or self.retiring:
+            try:
+                pid, _ = os.wait()
+            except ChildProcessError:
+                break
+            self.children.pop(pid, None)
+            self.retiring.discard(pid)
+
+    def run(self):
+        import main
+
+        self.socket = self._bind()
+        print(f"Loading services before forking {self.workers} workers...")
+        self._load(main.preload_services)
+        main.services_preloaded = True
+
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGTERM, self._handle_stop)
+
+        for slot in range(self.workers):
+            self._spawn(slot)
+
+        try:
+            while not self._stopping:
+                self._reap()
+                self._respawn_due()
+                if self._reload:
+                    self._reload = False
+                    self._rolling_restart()
+                time.sleep(0.5)
+        finally:
+            print("Stopping workers...")
+            self._stop()
+            self.socket.close()
@@ -8,10 +8,14 @@ import os
 import sys
 from pathlib import Path
 
+from dotenv import load_dotenv
+
 # Add the backend directory to Python path
 backend_dir = Path(__file__).parent
 sys.path.insert(0, str(backend_dir))
 
+load_dotenv()
+
 def main():
     """Run the FastAPI server"""
     
@@ -19,11 +23,20 @@ def main():
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", 8000))
     debug = os.getenv("DEBUG", "true").lower() == "true"
+    # Pre-forked worker processes outside debug mode, one per core by default
+    workers = int(os.getenv("WORKERS", "0")) or os.cpu_count() or 1
     
     print(f"Starting Xinference Q&A Agent Backend...")
     print(f"Server will run on http://{host}:{port}")
     print(f"Debug mode: {debug}")
     
+    # The reloader needs a single process, and fork is not available everywhere
+    if not debug and hasattr(os, "fork"):
+        from prefork import PreforkServer
+
+        PreforkServer(host, port, workers, log_level="info").run()
+        return
+    
     # Run the server
     uvicorn.run(
         "main:app",
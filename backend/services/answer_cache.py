@@ -0,0 +1,62 @@
+import hashlib
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from models.schemas import GeneratedAnswer
+
+
+def normalize_question(question: str) -> str:
+    """Normalize a question so trivially different spellings share a cache entry"""
+    text = unicodedata.normalize("NFKC", question).casefold()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip("?!.。？！ ")
+
+
+class AnswerCache:
+    """Bounded LRU cache of generated answers with a time-to-live"""
+
+    def __init__(self, max_size: int = 1000, ttl: float = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, GeneratedAnswer]]" = OrderedDict()
+
+    @staticmethod
+    def make_key(question: str, language: str, source_urls: List[str], context: Optional[str] = None) -> str:
+        """Key an answer by the question, its language and the sources it was generated from"""
+        sources_hash = hashlib.sha256("\n".join(source_urls).encode("utf-8")).hexdigest()
+        parts = [normalize_question(question), language, sources_hash, context or ""]
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[GeneratedAnswer]:
+        """Return the cached answer, or None if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, answer = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return answer
+
+    def set(self, key: str, answer: GeneratedAnswer):
+        """Store an answer, evicting the least recently used entries beyond the size bound"""
+        if self.max_size <= 0:
+            return
+
+        self._entries[key] = (time.monotonic() + self.ttl, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry, called when the search index is rebuilt"""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,151 @@
+import hashlib
+import re
+from typing import List, Dict, Any
+
+from models.schemas import DocumentationPage, GitHubIssue, SourceType
+
+# Target passage size in characters and how much of the previous passage is
+# repeated at the start of the next one so that an answer spanning a
+# boundary is still found in one piece
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 100
+
+_SENTENCE_END = re.compile(r'(?<=[.!?。！？])\s+')
+
+
+def _passage_id(prefix: str, key: str, ordinal: int) -> str:
+    """Build an ID that stays the same as long as the source structure does"""
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+    return f"{prefix}-{digest}-{ordinal}"
+
+
+def _split_long_block(text: str, size: int) -> List[str]:
+    """Split a block longer than the passage size at sentence or word boundaries"""
+    pieces = []
+    current = ""
+
+    for sentence in _SENTENCE_END.split(text):
+        while len(sentence) > size:
+            cut = sentence.rfind(' ', 0, size)
+            if cut <= 0:
+                cut = size
+            pieces.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+
+        if current and len(current) + 1 + len(sentence) > size:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+
+    if current:
+        pieces.append(current)
+    return [piece for piece in pieces if piece]
+
+
+def _tail(text: str, overlap: int) -> str:
+    """Last `overlap` characters of a passage, starting on a word boundary"""
+    if overlap <= 0 or len(text) <= overlap:
+        return ""
+    tail = text[-overlap:]
+    space = tail.find(' ')
+    return tail[space + 1:] if 0 <= space < len(tail) - 1 else tail
+
+
+def split_into_passages(blocks: List[str], size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Pack paragraphs into overlapping passages of roughly `size` characters"""
+    units = []
+    for block in blocks:
+        block = block.strip()
+        if not block:
+            continue
+        if len(block) > size:
+            # Leave room for the overlap carried over from the previous passage
+            units.extend(_split_long_block(block, max(size - overlap, overlap)))
+        else:
+            units.append(block)
+
+    passages = []
+    current = ""
+    for unit in units:
+        if current and len(current) + 1 + len(unit) > size:
+            passages.append(current)
+            tail = _tail(current, overlap)
+            current = f"{tail} {unit}" if tail else unit
+        else:
+            current = f"{current}\n{unit}" if current else unit
+
+    if current:
+        passages.append(current)
+    return passages
+
+
+def chunk_documentation_page(page: DocumentationPage) -> List[Dict[str, Any]]:
+    """Split a documentation page into passages, one heading section at a time"""
+    sections = page.sections or [
+        {'heading': '', 'anchor': '', 'paragraphs': [page.content]}
+    ]
+
+    passages = []
+    for index, section in enumerate(sections):
+        heading = section.get('heading', '')
+        anchor = section.get('anchor', '')
+        url = f"{page.url}#{anchor}" if anchor else page.url
+        title = f"{page.title} - {heading}" if heading and heading != page.title else page.title
+        # Sections without an anchor share the page URL, their position and heading tell them apart
+        key = url if anchor else f"{page.url}|{index}|{heading}"
+
+        for ordinal, text in enumerate(split_into_passages(section.get('paragraphs', []))):
+            passages.append({
+                'id': _passage_id('doc', key, ordinal),
+                'parent': page.url,
+                'title': title,
+                'content': text,
+                'url': url,
+                'source_type': SourceType.DOCUMENTATION.value,
+                'metadata': {'section': page.section, 'heading': heading}
+            })
+
+    return passages
+
+
+def chunk_github_issue(issue: GitHubIssue) -> List[Dict[str, Any]]:
+    """Split a GitHub issue into passages from its body and each of its comments"""
+    metadata = {
+        'number': issue.number,
+        'state': issue.state,
+        'labels': issue.labels,
+        'author': issue.author
+    }
+
+    parts = [('body', issue.body)] + [
+        (f"comment-{i}", comment) for i, comment in enumerate(issue.comments, 1)
+    ]
+
+    passages = []
+    for part, text in parts:
+        blocks = re.split(r'\n\s*\n', text or "")
+        for ordinal, passage in enumerate(split_into_passages(blocks)):
+            passages.append({
+                'id': f"issue-{issue.number}-{part}-{ordinal}",
+                'parent': issue.url,
+                'title': issue.title,
+                'content': passage,
+                'url': issue.url,
+                'source_type': SourceType.GITHUB_ISSUE.value,
+                'metadata': {**metadata, 'part': part}
+            })
+
+    # Issues without a body are still findable by their title
+    if not passages:
+        passages.append({
+            'id': f"issue-{issue.number}-body-0",
+            'parent': issue.url,
+            'title': issue.title,
+            'content': "",
+            'url': issue.url,
+            'source_type': SourceType.GITHUB_ISSUE.value,
+            'metadata': {**metadata, 'part': 'body'}
+        })
+
+    return passages
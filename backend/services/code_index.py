@@ -0,0 +1,195 @@
+"""
+Local index over a checkout or tarball of the xinference repository.
+
+Files are cut into overlapping windows of lines and ranked with the same
+BM25 index as the documentation, using a tokenizer that also splits
+identifiers into their camelCase and snake_case parts, so that `LLMFamily`
+is found by "llm family" and `launch_model` by "launch".
+"""
+
+import heapq
+import os
+import re
+import tarfile
+from collections import Counter
+from typing import List, Dict, Iterator, Optional, Tuple
+
+from models.schemas import CodeSearchResult
+from services.search_index import SearchIndex
+
+WINDOW_LINES = 30
+WINDOW_OVERLAP = 10
+SNIPPET_LINES = 12
+MAX_FILE_BYTES = 1024 * 1024
+
+LANGUAGES = {
+    ".py": "python",
+    ".pyx": "cython",
+    ".md": "markdown",
+    ".rst": "restructuredtext",
+    ".yaml": "yaml",
+    ".yml": "yaml",
+    ".toml": "toml",
+    ".cfg": "ini",
+    ".ini": "ini",
+    ".sh": "shell",
+    ".js": "javascript",
+    ".ts": "typescript",
+    ".tsx": "typescript",
+    ".go": "go",
+    ".rs": "rust",
+    ".cpp": "cpp",
+    ".h": "cpp",
+    "Dockerfile": "dockerfile",
+}
+
+SKIPPED_DIRS = {".git", ".github", "node_modules", "__pycache__", "build", "dist", ".venv", "venv"}
+
+# Path terms count several times, like title terms of documents
+PATH_WEIGHT = 3
+
+_WORD_PATTERN = re.compile(r'\w+')
+_PART_PATTERN = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+')
+
+
+def tokenize_code(text: str) -> List[str]:
+    """Lowercase identifiers followed by their camelCase and snake_case parts"""
+    tokens = []
+    for word in _WORD_PATTERN.findall(text):
+        tokens.append(word.lower())
+
+        parts = [part for chunk in word.split('_') for part in _PART_PATTERN.findall(chunk)]
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+
+def _language(path: str) -> Optional[str]:
+    name = os.path.basename(path)
+    return LANGUAGES.get(name) or LANGUAGES.get(os.path.splitext(name)[1])
+
+
+def _iter_directory(root: str) -> Iterator[Tuple[str, bytes]]:
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIPPED_DIRS)
+        for filename in sorted(filenames):
+            full_path = os.path.join(directory, filename)
+            path = os.path.relpath(full_path, root).replace(os.sep, '/')
+            if _language(path) and os.path.getsize(full_path) <= MAX_FILE_BYTES:
+                with open(full_path, 'rb') as f:
+                    yield path, f.read()
+
+
+def _iter_tarball(archive: str) -> Iterator[Tuple[str, bytes]]:
+    with tarfile.open(archive) as tar:
+        for member in tar:
+            if not member.isfile() or member.size > MAX_FILE_BYTES:
+                continue
+
+            # GitHub tarballs put everything under a single "<repo>-<ref>/" directory
+            parts = member.name.split('/')
+            if len(parts) > 1:
+                parts = parts[1:]
+            if any(part in SKIPPED_DIRS for part in parts[:-1]):
+                continue
+
+            path = '/'.join(parts)
+            if _language(path):
+                yield path, tar.extractfile(member).read()
+
+
+class CodeIndex:
+    """BM25 search over line windows of repository files"""
+
+    def __init__(self, repository: str, ref: str = "main"):
+        self.repository = repository
+        self.ref = ref
+        self.files: Dict[str, List[str]] = {}
+        self.index = SearchIndex()
+
+    @classmethod
+    def load(cls, source: str, repository: str, ref: str = "main") -> "CodeIndex":
+        """Index a checkout directory or a (compressed) tarball of the repository"""
+        code_index = cls(repository, ref)
+        files = _iter_directory(source) if os.path.isdir(source) else _iter_tarball(source)
+        for path, data in files:
+            code_index.files[path] = data.decode('utf-8', errors='replace').splitlines()
+        code_index._build()
+        return code_index
+
+    def _build(self):
+        windows = []
+        term_counts = []
+        step = WINDOW_LINES - WINDOW_OVERLAP
+
+        for path, lines in self.files.items():
+            if not lines:
+                continue
+            path_terms = Counter(tokenize_code(path.replace('/', ' ')))
+            for start in range(0, max(len(lines) - WINDOW_OVERLAP, 1), step):
+                end = min(start + WINDOW_LINES, len(lines))
+                counts = Counter(tokenize_code('\n'.join(lines[start:end])))
+                for term, count in path_terms.items():
+                    counts[term] += count * PATH_WEIGHT
+
+                # Line numbers are 1-based and inclusive
+                windows.append({'path': path, 'start_line': start + 1, 'end_line': end})
+                term_counts.append(counts)
+
+        self.index = SearchIndex(windows, term_counts=term_counts)
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def _url(self, path: str, start_line: int, end_line: int) -> str:
+        return f"https://github.com/{self.repository}/blob/{self.ref}/{path}#L{start_line}-L{end_line}"
+
+    def search(self, query: str, limit: int = 5) -> List[Tuple[CodeSearchResult, float]]:
+        """Best window of the best matching files, with a line-numbered snippet"""
+        query_terms = set(tokenize_code(query))
+        scores = self.index.search(query_terms)
+        if not scores:
+            return []
+
+        # Against an absolute reference, a weak best match stays a weak match
+        ceiling = self.index.score_ceiling(query_terms)
+        ranked = [(-score, doc_id) for doc_id, score in scores.items()]
+        heapq.heapify(ranked)
+
+        results = []
+        seen_paths = set()
+
+        while ranked and len(results) < limit:
+            neg_score, doc_id = heapq.heappop(ranked)
+            score = -neg_score
+            window = self.index.documents[doc_id]
+            path = window['path']
+            if path in seen_paths:
+                continue
+            seen_paths.add(path)
+
+            lines = self.files[path]
+            start, end = window['start_line'], window['end_line']
+            matching = [
+                number for number in range(start, end + 1)
+                if query_terms.intersection(tokenize_code(lines[number - 1]))
+            ]
+
+            # Show the lines around the first match
+            first = max(start, (matching[0] if matching else start) - 2)
+            last = min(end, first + SNIPPET_LINES - 1)
+            snippet = '\n'.join(f"{number}: {lines[number - 1]}" for number in range(first, last + 1))
+
+            results.append((
+                CodeSearchResult(
+                    file_path=path,
+                    content=snippet,
+                    url=self._url(path, start, end),
+                    repository=self.repository,
+                    language=_language(path) or "unknown",
+                    line_numbers=matching
+                ),
+                min(score / ceiling, 1.0)
+            ))
+
+        return results
@@ -0,0 +1,79 @@
+import math
+import re
+from typing import List, Set
+
+from models.schemas import SearchResult
+
+# Passages sharing this much of their character shingles are treated as the same text
+DUPLICATE_SIMILARITY = 0.8
+SHINGLE_SIZE = 5
+
+_CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+_SPACE_PATTERN = re.compile(r'\s+')
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a BPE tokenizer.
+
+    CJK characters take about one token each, other text about one token
+    per four characters.
+    """
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def _shingles(text: str) -> Set[str]:
+    text = _SPACE_PATTERN.sub(' ', text.lower()).strip()
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def _similarity(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def format_source(index: int, result: SearchResult) -> str:
+    """Context block of one search result"""
+    source_type = result.source_type.value.replace("_", " ").title()
+    return (
+        f"Source {index} ({source_type}): {result.title}\n"
+        f"URL: {result.url}\n"
+        f"{result.content}"
+    )
+
+
+def pack_context(search_results: List[SearchResult], token_budget: int) -> List[SearchResult]:
+    """Pick the results to put in the prompt.
+
+    Near-duplicates of a more relevant result are dropped, then results are
+    added by relevance per token while they fit in `token_budget`. The most
+    relevant result is always kept. The picked results keep their original
+    order.
+    """
+    unique = []
+    seen_shingles = []
+    for result in search_results:
+        shingles = _shingles(result.content)
+        if any(_similarity(shingles, other) >= DUPLICATE_SIMILARITY for other in seen_shingles):
+            continue
+        seen_shingles.append(shingles)
+        unique.append(result)
+
+    if not unique:
+        return []
+
+    # The source number does not change the size noticeably
+    costs = {id(result): estimate_tokens(format_source(0, result)) for result in unique}
+
+    picked = {id(unique[0])}
+    used = costs[id(unique[0])]
+    by_density = sorted(unique[1:], key=lambda r: r.relevance_score / max(costs[id(r)], 1), reverse=True)
+    for result in by_density:
+        if used + costs[id(result)] <= token_budget:
+            picked.add(id(result))
+            used += costs[id(result)]
+
+    return [result for result in unique if id(result) in picked]
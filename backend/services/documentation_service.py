@@ -1,121 +1,398 @@
 import asyncio
+import hashlib
+import heapq
 import httpx
 from bs4 import BeautifulSoup
-from typing import List, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from typing import List, Dict, Any, Optional, Tuple
 import re
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin, urlparse, urldefrag
+from xml.etree import ElementTree
 import os
 import json
 from datetime import datetime
 
 from models.schemas import DocumentationPage, SearchResult, SourceType
+from services.search_index import normalize_text
+
+# lxml parses several times faster than the built-in parser when it is installed
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# Crawler limits: concurrent requests, requests per second to one host,
+# pages per crawl and processes parsing HTML (0 parses in a thread instead)
+DOC_CRAWL_CONCURRENCY = int(os.getenv("DOC_CRAWL_CONCURRENCY", "8"))
+DOC_CRAWL_RATE_PER_HOST = float(os.getenv("DOC_CRAWL_RATE_PER_HOST", "10"))
+DOC_CRAWL_MAX_PAGES = int(os.getenv("DOC_CRAWL_MAX_PAGES", "1000"))
+DOC_PARSE_WORKERS = int(os.getenv("DOC_PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+SYNC_STATE_FILE = "data/documentation_sync_state.json"
+
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+# Crawled even when the sitemap is missing, links found on them lead to the rest
+SEED_PATHS = [
+    "",  # Main page
+    "getting_started/index.html",
+    "getting_started/installation.html",
+    "getting_started/using_xinference.html",
+    "getting_started/troubleshooting.html",
+    "getting_started/using_docker_image.html",
+    "getting_started/using_kubernetes.html",
+    "getting_started/environments.html",
+    "user_guide/index.html",
+    "user_guide/backends.html",
+    "user_guide/client_api.html",
+    "models/index.html",
+    "models/builtin/index.html",
+    "models/custom.html",
+    "examples/index.html"
+]
+
+# Generated Sphinx pages without documentation content
+SKIPPED_PAGES = {"genindex.html", "search.html", "py-modindex.html"}
+
+_BLOCK_TAGS = {'h1', 'h2', 'h3', 'h4', 'p', 'pre', 'li', 'dt', 'dd', 'blockquote'}
+
+
+def _extract_sections(content_elem, page_title: str) -> List[Dict[str, Any]]:
+    """Split page content into heading sections made of paragraphs"""
+    sections = [{'heading': page_title, 'anchor': '', 'paragraphs': []}]
+
+    for elem in content_elem.find_all(list(_BLOCK_TAGS)):
+        # Skip blocks nested in another block, their text is already included
+        if any(parent.name in _BLOCK_TAGS for parent in elem.parents if parent is not content_elem):
+            continue
+
+        if elem.name == 'pre':
+            text = elem.get_text().strip()
+        else:
+            text = re.sub(r'\s+', ' ', elem.get_text(' ')).replace('¶', '').strip()
+        if not text:
+            continue
+
+        if elem.name in ('h1', 'h2', 'h3', 'h4'):
+            # Sphinx puts the anchor on the enclosing <section>
+            anchor = elem.get('id') or (elem.parent.get('id') if elem.parent else None) or ''
+            sections.append({'heading': text, 'anchor': anchor, 'paragraphs': []})
+        else:
+            sections[-1]['paragraphs'].append(text)
+
+    return [section for section in sections if section['paragraphs']]
+
+
+def parse_documentation_html(html: str) -> Dict[str, Any]:
+    """Extract title, text, sections and links of a page.
+
+    Module-level and returning plain data so it can run in a worker process.
+    """
+    soup = BeautifulSoup(html, HTML_PARSER)
+
+    # Extract title
+    title_elem = soup.find('h1') or soup.find('title')
+    title = title_elem.get_text().strip() if title_elem else "Untitled"
+
+    # Links are collected before the navigation is removed, it links every page
+    links = [a['href'] for a in soup.find_all('a', href=True)]
+
+    # Extract main content
+    content_elem = soup.find('main') or soup.find('div', class_='document') or soup.find('body')
+    if content_elem:
+        # Remove navigation and other non-content elements
+        for elem in content_elem.find_all(['nav', 'header', 'footer', 'aside']):
+            elem.decompose()
+
+        sections = _extract_sections(content_elem, title)
+
+        content = content_elem.get_text()
+        # Clean up whitespace
+        content = re.sub(r'\s+', ' ', content).strip()
+    else:
+        sections = []
+        content = ""
+
+    return {'title': title, 'content': content, 'sections': sections, 'links': links}
+
+
+class HostRateLimiter:
+    """Spaces out requests to the same host to at most `rate` per second"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot: Dict[str, float] = {}
+
+    async def wait(self, host: str):
+        if not self.interval:
+            return
+
+        # Reserve the next free slot before sleeping, so concurrent callers queue up
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot.get(host, now))
+        self._next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
 
 class DocumentationService:
     def __init__(self):
         self.base_url = "https://inference.readthedocs.io/en/latest/"
         self.pages = []
         self.client = None
+        # Page URL -> ETag, Last-Modified, content hash and links of the last fetch
+        self.validators: Dict[str, Dict[str, Any]] = {}
+        # Normalized fields of self.pages for search, see _set_pages
+        self._fields_source = None
+        self._fields: List[Tuple[DocumentationPage, str, str, float]] = []
         
     async def initialize(self):
         """Initialize the documentation service"""
         print("Initializing documentation service...")
-        self.client = httpx.AsyncClient(timeout=30.0)
+        self.connect()
         
         # Load cached pages or scrape new ones
         await self._load_or_scrape_pages()
         print(f"Documentation service initialized with {len(self.pages)} pages")
     
+    def connect(self):
+        """Open the HTTP client used for scraping"""
+        self.client = httpx.AsyncClient(timeout=30.0)
+
     async def _load_or_scrape_pages(self):
         """Load cached pages or scrape from documentation"""
-        cache_file = "data/documentation_cache.json"
-        
-        if os.path.exists(cache_file):
-            # Load from cache
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                cached_data = json.load(f)
-                self.pages = [DocumentationPage(**page) for page in cached_data]
-            print(f"Loaded {len(self.pages)} pages from cache")
-        else:
+        if not self.load_cached_pages():
             # Scrape documentation
             await self._scrape_documentation()
+
+    def load_cached_pages(self) -> bool:
+        """Load the cached pages and their validators, False if there is no cache"""
+        cache_file = "data/documentation_cache.json"
+
+        if not os.path.exists(cache_file):
+            return False
+
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cached_data = json.load(f)
+            self._set_pages([DocumentationPage(**page) for page in cached_data])
+        self._load_sync_state()
+        print(f"Loaded {len(self.pages)} pages from cache")
+        return True
     
-    async def _scrape_documentation(self):
-        """Scrape Xinference documentation"""
-        print("Scraping Xinference documentation...")
-        
-        # Key documentation URLs to scrape
-        urls_to_scrape = [
-            "",  # Main page
-            "getting_started/index.html",
-            "getting_started/installation.html",
-            "getting_started/using_xinference.html",
-            "getting_started/troubleshooting.html",
-            "getting_started/using_docker_image.html",
-            "getting_started/using_kubernetes.html",
-            "getting_started/environments.html",
-            "user_guide/index.html",
-            "user_guide/backends.html",
-            "user_guide/client_api.html",
-            "models/index.html",
-            "models/builtin/index.html",
-            "models/custom.html",
-            "examples/index.html"
-        ]
-        
-        scraped_pages = []
-        
-        for url_path in urls_to_scrape:
+    def _load_sync_state(self):
+        """Load the validators of the cached pages"""
+        if os.path.exists(SYNC_STATE_FILE):
             try:
-                full_url = urljoin(self.base_url, url_path)
-                response = await self.client.get(full_url)
-                response.raise_for_status()
-                
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Extract title
-                title_elem = soup.find('h1') or soup.find('title')
-                title = title_elem.get_text().strip() if title_elem else "Untitled"
-                
-                # Extract main content
-                content_elem = soup.find('main') or soup.find('div', class_='document') or soup.find('body')
-                if content_elem:
-                    # Remove navigation and other non-content elements
-                    for elem in content_elem.find_all(['nav', 'header', 'footer', 'aside']):
-                        elem.decompose()
-                    
-                    content = content_elem.get_text()
-                    # Clean up whitespace
-                    content = re.sub(r'\s+', ' ', content).strip()
-                else:
-                    content = ""
-                
-                # Determine section
-                section = self._determine_section(url_path)
-                
-                page = DocumentationPage(
-                    title=title,
-                    url=full_url,
-                    content=content,
-                    section=section,
-                    last_updated=datetime.now()
-                )
-                
-                scraped_pages.append(page)
-                print(f"Scraped: {title}")
-                
-                # Be respectful with requests
-                await asyncio.sleep(0.5)
-                
+                with open(SYNC_STATE_FILE, 'r', encoding='utf-8') as f:
+                    self.validators = json.load(f).get("pages", {})
             except Exception as e:
-                print(f"Error scraping {url_path}: {e}")
-                continue
-        
-        self.pages = scraped_pages
-        
-        # Cache the scraped pages
-        await self._cache_pages()
-        print(f"Scraped {len(scraped_pages)} documentation pages")
-    
+                print(f"Error loading documentation sync state: {e}")
+
+    def _save_sync_state(self):
+        """Persist the validators of the cached pages"""
+        os.makedirs("data", exist_ok=True)
+        with open(SYNC_STATE_FILE, 'w', encoding='utf-8') as f:
+            json.dump({"pages": self.validators}, f, ensure_ascii=False, separators=(",", ":"))
+
+    async def _scrape_documentation(self):
+        """Crawl the Xinference documentation site.
+
+        Known pages are fetched conditionally, and pages whose body hash did
+        not change are not parsed again. Unchanged pages keep the same
+        DocumentationPage object, which lets the search index reuse their
+        passages.
+        """
+        print("Scraping Xinference documentation...")
+
+        seeds = await self._discover_urls()
+        print(f"Crawling from {len(seeds)} seed pages")
+
+        scraped_pages, validators, changed = await self._crawl(seeds)
+        if not scraped_pages and self.pages:
+            print("Crawl returned no pages, keeping the previous ones")
+            return
+
+        removed = len({page.url for page in self.pages} - {page.url for page in scraped_pages})
+        self.validators = validators
+        self._save_sync_state()
+
+        if changed or removed:
+            self._set_pages(scraped_pages)
+            # Cache the scraped pages
+            await self._cache_pages()
+
+        print(f"Scraped {len(scraped_pages)} documentation pages ({changed} changed, {removed} removed)")
+
+    async def _discover_urls(self) -> List[str]:
+        """Page URLs listed in the Sphinx sitemap, or the fixed seed pages without one"""
+        urls = []
+        try:
+            urls = await self._read_sitemap(urljoin(self.base_url, "sitemap.xml"))
+        except Exception as e:
+            print(f"No usable sitemap ({e}), crawling from the seed pages")
+
+        urls.extend(urljoin(self.base_url, path) for path in SEED_PATHS)
+
+        # In-site links found while crawling cover whatever the sitemap misses
+        return list(dict.fromkeys(url for url in map(self._normalize_url, urls) if url))
+
+    async def _read_sitemap(self, sitemap_url: str, depth: int = 0) -> List[str]:
+        """Locations listed in a sitemap, following one level of sitemap index"""
+        response = await self.client.get(sitemap_url)
+        response.raise_for_status()
+
+        root = ElementTree.fromstring(response.content)
+        locations = [elem.text.strip() for elem in root.iter(SITEMAP_NS + "loc") if elem.text]
+
+        if root.tag == SITEMAP_NS + "sitemapindex":
+            if depth > 0:
+                return []
+            urls = []
+            for location in locations:
+                urls.extend(await self._read_sitemap(location, depth + 1))
+            return urls
+        return locations
+
+    def _normalize_url(self, url: str) -> Optional[str]:
+        """Canonical form of a documentation page URL, None if it is not one"""
+        url = urldefrag(url)[0].split('?', 1)[0]
+        if not url.startswith(self.base_url):
+            return None
+
+        if url.endswith('/'):
+            url += "index.html"
+
+        path = url[len(self.base_url):]
+        if not path.endswith('.html') or path in SKIPPED_PAGES:
+            return None
+        # _static, _sources, _modules and friends hold no prose
+        if any(part.startswith('_') for part in path.split('/')):
+            return None
+        return url
+
+    async def _crawl(self, seeds: List[str]) -> Tuple[List[DocumentationPage], Dict[str, Dict[str, Any]], int]:
+        """Fetch pages concurrently and follow their in-site links, up to DOC_CRAWL_MAX_PAGES.
+
+        Returns the pages, their validators and how many of them changed.
+        """
+        semaphore = asyncio.Semaphore(DOC_CRAWL_CONCURRENCY)
+        rate_limiter = HostRateLimiter(DOC_CRAWL_RATE_PER_HOST)
+        pool = None
+        if DOC_PARSE_WORKERS > 0:
+            # The server has threads by now, forking it could deadlock the parsers
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            pool = ProcessPoolExecutor(
+                max_workers=DOC_PARSE_WORKERS,
+                mp_context=multiprocessing.get_context(start_method)
+            )
+
+        previous_pages = {page.url: page for page in self.pages}
+        seen = set(seeds[:DOC_CRAWL_MAX_PAGES])
+        pages: Dict[str, DocumentationPage] = {}
+        validators: Dict[str, Dict[str, Any]] = {}
+        changed = 0
+
+        try:
+            pending = {
+                asyncio.create_task(self._crawl_page(url, previous_pages.get(url), semaphore, rate_limiter, pool))
+                for url in seen
+            }
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result is None:
+                        continue
+
+                    page, page_validators = result
+                    pages[page.url] = page
+                    validators[page.url] = page_validators
+                    if page is not previous_pages.get(page.url):
+                        changed += 1
+                        print(f"Scraped: {page.title}")
+
+                    for link in page_validators.get('links', []):
+                        if link not in seen and len(seen) < DOC_CRAWL_MAX_PAGES:
+                            seen.add(link)
+                            pending.add(asyncio.create_task(
+                                self._crawl_page(link, previous_pages.get(link), semaphore, rate_limiter, pool)
+                            ))
+        finally:
+            if pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+        return [pages[url] for url in sorted(pages)], validators, changed
+
+    async def _crawl_page(
+        self,
+        url: str,
+        previous: Optional[DocumentationPage],
+        semaphore: asyncio.Semaphore,
+        rate_limiter: HostRateLimiter,
+        pool
+    ):
+        """Fetch one page, parsing it only if it changed since `previous`.
+
+        Returns the page with its validators, which include its outgoing links.
+        """
+        known = self.validators.get(url, {}) if previous else {}
+        headers = {}
+        if known.get('etag'):
+            headers['If-None-Match'] = known['etag']
+        if known.get('last_modified'):
+            headers['If-Modified-Since'] = known['last_modified']
+
+        try:
+            async with semaphore:
+                await rate_limiter.wait(urlparse(url).netloc)
+                response = await self.client.get(url, headers=headers)
+
+            if response.status_code == 304:
+                return previous, known
+            response.raise_for_status()
+
+            if 'html' not in response.headers.get('content-type', 'text/html'):
+                return None
+
+            validators = {
+                'etag': response.headers.get('etag'),
+                'last_modified': response.headers.get('last-modified'),
+                'content_hash': hashlib.sha256(response.content).hexdigest()
+            }
+
+            # Servers without validators still often send the same bytes
+            if previous and known.get('content_hash') == validators['content_hash']:
+                validators['links'] = known.get('links', [])
+                return previous, validators
+
+            # Parsing is CPU-bound, keep it off the event loop
+            loop = asyncio.get_running_loop()
+            parsed = await loop.run_in_executor(pool, parse_documentation_html, response.text)
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code in (404, 410):
+                print(f"Page {url} is gone ({e.response.status_code})")
+                return None
+            print(f"Error scraping {url}: {e}")
+            # A failed fetch is not a removal, keep the page and its links until the next crawl
+            return (previous, known) if previous else None
+        except Exception as e:
+            print(f"Error scraping {url}: {e}")
+            return (previous, known) if previous else None
+
+        page = DocumentationPage(
+            title=parsed['title'],
+            url=url,
+            content=parsed['content'],
+            section=self._determine_section(url[len(self.base_url):]),
+            last_updated=datetime.now(),
+            sections=parsed['sections']
+        )
+        links = (self._normalize_url(urljoin(url, href)) for href in parsed['links'])
+        validators['links'] = list(dict.fromkeys(link for link in links if link))
+        return page, validators
+
     def _determine_section(self, url_path: str) -> str:
         """Determine the section based on URL path"""
         if url_path.startswith("getting_started"):
@@ -147,17 +424,35 @@ class DocumentationService:
             pages_data.append(page_dict)
         
         with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(pages_data, f, ensure_ascii=False, indent=2)
+            json.dump(pages_data, f, ensure_ascii=False, separators=(",", ":"))
     
+    def _set_pages(self, pages: List[DocumentationPage]):
+        """Replace the pages, computing their search fields at once rather than on the first query"""
+        self.pages = pages
+        self._search_fields()
+
+    def _search_fields(self) -> List[Tuple[DocumentationPage, str, str, float]]:
+        """Normalized title and content and static boost of every page, computed once per set of pages"""
+        if self._fields_source is not self.pages:
+            fields = []
+            for page in self.pages:
+                title = normalize_text(page.title)
+                # Boost score for troubleshooting pages
+                boost = 0.2 if "troubleshoot" in title or "error" in title else 0.0
+                fields.append((page, title, normalize_text(page.content), boost))
+            self._fields = fields
+            self._fields_source = self.pages
+        return self._fields
+
     async def search(self, query: str, limit: int = 5) -> List[SearchResult]:
         """Search documentation pages"""
-        query_lower = query.lower()
-        results = []
+        query_normalized = normalize_text(query)
+        matches = []
         
-        for page in self.pages:
+        for page, title, content, boost in self._search_fields():
             # Simple text matching (can be enhanced with better scoring)
-            title_match = query_lower in page.title.lower()
-            content_match = query_lower in page.content.lower()
+            title_match = query_normalized in title
+            content_match = query_normalized in content
             
             if title_match or content_match:
                 # Calculate simple relevance score
@@ -166,31 +461,27 @@ class DocumentationService:
                     score += 0.7
                 if content_match:
                     score += 0.3
-                
-                # Boost score for troubleshooting pages
-                if "troubleshoot" in page.title.lower() or "error" in page.title.lower():
-                    score += 0.2
-                
-                result = SearchResult(
-                    title=page.title,
-                    content=page.content[:300] + "..." if len(page.content) > 300 else page.content,
-                    url=page.url,
-                    source_type=SourceType.DOCUMENTATION,
-                    relevance_score=min(score, 1.0),
-                    metadata={"section": page.section}
-                )
-                results.append(result)
+                matches.append((min(score + boost, 1.0), page))
         
-        # Sort by relevance and return top results
-        results.sort(key=lambda x: x.relevance_score, reverse=True)
-        return results[:limit]
+        # Only the top results are turned into SearchResult objects
+        return [
+            SearchResult(
+                title=page.title,
+                content=page.content[:300] + "..." if len(page.content) > 300 else page.content,
+                url=page.url,
+                source_type=SourceType.DOCUMENTATION,
+                relevance_score=score,
+                metadata={"section": page.section}
+            )
+            for score, page in heapq.nlargest(limit, matches, key=lambda match: match[0])
+        ]
     
     async def get_all_pages(self) -> List[DocumentationPage]:
         """Get all documentation pages"""
         return self.pages
     
     async def refresh_documentation(self):
-        """Refresh documentation by re-scraping"""
+        """Re-crawl the documentation, re-parsing only the pages that changed"""
         await self._scrape_documentation()
         print("Documentation refreshed successfully")
     
@@ -1,12 +1,24 @@
 import asyncio
+import heapq
 import httpx
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import os
 import json
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
 import re
 
 from models.schemas import GitHubIssue, SearchResult, SourceType, CodeSearchResult
+from services.search_index import normalize_text
+from services.code_index import CodeIndex
+
+# Checkout directory or tarball of the xinference repository searched by
+# search_code, without it code search falls back to the GitHub API
+XINFERENCE_REPO_PATH = os.getenv("XINFERENCE_REPO_PATH")
+XINFERENCE_REPO_REF = os.getenv("XINFERENCE_REPO_REF", "main")
+
+HELPFUL_LABELS = {"bug", "question", "documentation", "help wanted"}
+RECENT_ISSUE_DAYS = 30
 
 class GitHubService:
     def __init__(self):
@@ -15,6 +27,12 @@ class GitHubService:
         self.repo_name = "inference"
         self.client = None
         self.issues_cache = []
+        self.code_index: Optional[CodeIndex] = None
+        # Normalized fields of self.issues_cache for search, see _set_issues
+        self._fields_source = None
+        self._fields: List[Tuple[GitHubIssue, str, str, float, datetime]] = []
+        self.etags: Dict[str, str] = {}
+        self._used_etags: Dict[str, str] = {}
         self.headers = {
             "Accept": "application/vnd.github.v3+json",
             "User-Agent": "Xinference-QA-Agent"
@@ -28,33 +46,219 @@ class GitHubService:
     async def initialize(self):
         """Initialize the GitHub service"""
         print("Initializing GitHub service...")
-        self.client = httpx.AsyncClient(timeout=30.0, headers=self.headers)
+        self.connect()
         
         # Load cached issues or fetch new ones
         await self._load_or_fetch_issues()
+
+        # The checkout is pinned to a ref, it is indexed once per process
+        if XINFERENCE_REPO_PATH and self.code_index is None:
+            await self._load_code_index()
         print(f"GitHub service initialized with {len(self.issues_cache)} issues")
+
+    def connect(self):
+        """Open the HTTP client used for the GitHub API"""
+        self.client = httpx.AsyncClient(timeout=30.0, headers=self.headers)
+
+    async def _load_code_index(self):
+        """Index the local copy of the repository for code search"""
+        if not os.path.exists(XINFERENCE_REPO_PATH):
+            print(f"Warning: XINFERENCE_REPO_PATH {XINFERENCE_REPO_PATH} does not exist")
+            return
+
+        try:
+            self.code_index = await asyncio.to_thread(
+                CodeIndex.load, XINFERENCE_REPO_PATH, f"{self.repo_owner}/{self.repo_name}", XINFERENCE_REPO_REF
+            )
+            print(f"Indexed {len(self.code_index)} source files from {XINFERENCE_REPO_PATH}")
+        except Exception as e:
+            print(f"Error indexing source code at {XINFERENCE_REPO_PATH}: {e}")
     
     async def _load_or_fetch_issues(self):
-        """Load cached issues or fetch from GitHub API"""
+        """Load cached issues and sync the changes since the cache was written"""
         cache_file = "data/github_issues_cache.json"
         
-        if os.path.exists(cache_file):
-            # Check if cache is recent (less than 1 hour old)
+        if self.load_cached_issues():
+            # Cache is recent (less than 1 hour old), no need to sync
             cache_age = datetime.now() - datetime.fromtimestamp(os.path.getmtime(cache_file))
             if cache_age < timedelta(hours=1):
-                with open(cache_file, 'r', encoding='utf-8') as f:
-                    cached_data = json.load(f)
-                    self.issues_cache = [GitHubIssue(**issue) for issue in cached_data]
-                print(f"Loaded {len(self.issues_cache)} issues from cache")
                 return
         
-        # Fetch fresh issues
-        await self._fetch_issues()
+        # Fetch only what changed, or everything if there is no cache yet
+        await self._sync_issues()
+
+    def load_cached_issues(self) -> bool:
+        """Load the cached issues and their ETags, False if there is no cache"""
+        cache_file = "data/github_issues_cache.json"
+
+        if not os.path.exists(cache_file):
+            return False
+
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cached_data = json.load(f)
+            self._set_issues([GitHubIssue(**issue) for issue in cached_data])
+        print(f"Loaded {len(self.issues_cache)} issues from cache")
+
+        self._load_sync_state()
+        return True
     
+    def _load_sync_state(self):
+        """Load the ETags of previous requests"""
+        state_file = "data/github_sync_state.json"
+
+        if os.path.exists(state_file):
+            with open(state_file, 'r', encoding='utf-8') as f:
+                self.etags = json.load(f).get("etags", {})
+
+    def _save_sync_state(self):
+        """Persist the ETags so conditional requests survive restarts"""
+        os.makedirs("data", exist_ok=True)
+        state_file = "data/github_sync_state.json"
+
+        with open(state_file, 'w', encoding='utf-8') as f:
+            json.dump({"etags": self.etags}, f, ensure_ascii=False, indent=2)
+
+    def _high_water_mark(self) -> Optional[str]:
+        """Most recent `updated_at` of the cached issues, in GitHub's `since` format"""
+        if not self.issues_cache:
+            return None
+        latest = max(issue.updated_at for issue in self.issues_cache)
+        if latest.tzinfo is None:
+            latest = latest.replace(tzinfo=timezone.utc)
+        return latest.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    async def _get_conditional(self, url: str, params: Dict[str, Any]) -> Optional[httpx.Response]:
+        """GET with If-None-Match, returns None when GitHub answers 304 Not Modified"""
+        key = f"{url}?{urlencode(sorted(params.items()))}"
+        headers = {}
+        if key in self.etags:
+            headers["If-None-Match"] = self.etags[key]
+
+        response = await self.client.get(url, params=params, headers=headers)
+
+        # 304 responses do not count against the rate limit
+        if response.status_code == 304:
+            self._used_etags[key] = self.etags[key]
+            return None
+
+        response.raise_for_status()
+        if response.headers.get("ETag"):
+            self._used_etags[key] = response.headers["ETag"]
+        return response
+
+    def _parse_issue(self, issue_data: Dict[str, Any]) -> GitHubIssue:
+        """Build a GitHubIssue from an API payload"""
+        return GitHubIssue(
+            number=issue_data["number"],
+            title=issue_data["title"],
+            body=issue_data["body"] or "",
+            url=issue_data["html_url"],
+            state=issue_data["state"],
+            labels=[label["name"] for label in issue_data["labels"]],
+            created_at=datetime.fromisoformat(issue_data["created_at"].replace("Z", "+00:00")),
+            updated_at=datetime.fromisoformat(issue_data["updated_at"].replace("Z", "+00:00")),
+            author=issue_data["user"]["login"]
+        )
+
+    async def _sync_issues(self):
+        """Fetch the issues updated since the last sync and merge them into the cache"""
+        since = self._high_water_mark()
+        if not since:
+            await self._fetch_issues()
+            return
+
+        print(f"Syncing issues updated since {since}...")
+
+        self._used_etags = {}
+        previous = {issue.number: issue for issue in self.issues_cache}
+        changed: Dict[int, GitHubIssue] = {}
+        commented = []
+        page = 1
+        per_page = 100
+        max_pages = 50  # Safety net, a delta is normally a single page
+
+        while page <= max_pages:
+            try:
+                url = f"{self.base_url}/repos/{self.repo_owner}/{self.repo_name}/issues"
+                params = {
+                    "state": "all",
+                    "since": since,
+                    "per_page": per_page,
+                    "page": page,
+                    # Oldest first: if paging stops early, the high-water mark
+                    # only moves past issues that were actually received
+                    "sort": "updated",
+                    "direction": "asc"
+                }
+
+                response = await self._get_conditional(url, params)
+                if response is None:
+                    print(f"Issues page {page} not modified")
+                    break
+
+                page_issues = response.json()
+                for issue_data in page_issues:
+                    # Skip pull requests (they appear in issues API)
+                    if "pull_request" in issue_data:
+                        continue
+
+                    issue = self._parse_issue(issue_data)
+
+                    # `since` is inclusive, so the newest cached issue comes back every time
+                    cached = previous.get(issue.number)
+                    if cached and cached.updated_at >= issue.updated_at:
+                        continue
+
+                    changed[issue.number] = issue
+                    if issue_data.get("comments"):
+                        commented.append(issue)
+
+                if len(page_issues) < per_page:
+                    break
+                page += 1
+
+            except Exception as e:
+                print(f"Error syncing issues page {page}: {e}")
+                break
+
+        if changed:
+            # Keep the comments we already have in case they cannot be refreshed
+            for issue in commented:
+                if issue.number in previous:
+                    issue.comments = previous[issue.number].comments
+            await self._fetch_issue_comments(commented)
+
+            previous.update(changed)
+            self._set_issues(sorted(previous.values(), key=lambda i: i.updated_at, reverse=True))
+            await self._cache_issues()
+
+        # Delta pages are keyed by their `since`, those of earlier syncs never match again
+        self.etags = {key: etag for key, etag in self.etags.items() if "since=" not in key}
+        self.etags.update(self._used_etags)
+        self._save_sync_state()
+        print(f"Synced {len(changed)} changed issues, {len(self.issues_cache)} issues cached")
+
+    async def _fetch_issue_comments(self, issues: List[GitHubIssue]):
+        """Refresh the comments of individual issues"""
+        for issue in issues:
+            try:
+                url = f"{self.base_url}/repos/{self.repo_owner}/{self.repo_name}/issues/{issue.number}/comments"
+                params = {"per_page": 100}
+
+                response = await self._get_conditional(url, params)
+                if response is None:
+                    continue
+
+                issue.comments = [c["body"] for c in response.json() if c.get("body")]
+
+            except Exception as e:
+                print(f"Error fetching comments of issue {issue.number}: {e}")
+
     async def _fetch_issues(self):
         """Fetch issues from GitHub API"""
         print("Fetching issues from GitHub...")
         
+        self._used_etags = {}
         issues = []
         page = 1
         per_page = 100
@@ -83,18 +287,7 @@ class GitHubService:
                     if "pull_request" in issue_data:
                         continue
                     
-                    issue = GitHubIssue(
-                        number=issue_data["number"],
-                        title=issue_data["title"],
-                        body=issue_data["body"] or "",
-                        url=issue_data["html_url"],
-                        state=issue_data["state"],
-                        labels=[label["name"] for label in issue_data["labels"]],
-                        created_at=datetime.fromisoformat(issue_data["created_at"].replace("Z", "+00:00")),
-                        updated_at=datetime.fromisoformat(issue_data["updated_at"].replace("Z", "+00:00")),
-                        author=issue_data["user"]["login"]
-                    )
-                    issues.append(issue)
+                    issues.append(self._parse_issue(issue_data))
                 
                 print(f"Fetched page {page} with {len(page_issues)} issues")
                 page += 1
@@ -106,10 +299,61 @@ class GitHubService:
                 print(f"Error fetching issues page {page}: {e}")
                 break
         
-        self.issues_cache = issues
+        await self._fetch_comments(issues)
+
+        self._set_issues(issues)
         await self._cache_issues()
+        self.etags = self._used_etags
+        self._save_sync_state()
         print(f"Fetched {len(issues)} issues from GitHub")
     
+    async def _fetch_comments(self, issues: List[GitHubIssue]):
+        """Attach recent comments to the fetched issues"""
+        issues_by_number = {issue.number: issue for issue in issues}
+        comments_by_number: Dict[int, List[Dict[str, Any]]] = {}
+
+        page = 1
+        per_page = 100
+        max_pages = 5  # Limit to avoid rate limiting
+
+        # The repository-wide listing returns comments of all issues in a few requests
+        while page <= max_pages:
+            try:
+                url = f"{self.base_url}/repos/{self.repo_owner}/{self.repo_name}/issues/comments"
+                params = {
+                    "per_page": per_page,
+                    "page": page,
+                    "sort": "updated",
+                    "direction": "desc"
+                }
+
+                response = await self.client.get(url, params=params)
+                response.raise_for_status()
+
+                page_comments = response.json()
+                if not page_comments:
+                    break
+
+                for comment in page_comments:
+                    number = int(comment["issue_url"].rsplit("/", 1)[-1])
+                    if number in issues_by_number and comment.get("body"):
+                        comments_by_number.setdefault(number, []).append(comment)
+
+                page += 1
+
+                # Be respectful with API rate limits
+                await asyncio.sleep(0.5)
+
+            except Exception as e:
+                print(f"Error fetching comments page {page}: {e}")
+                break
+
+        for number, comments in comments_by_number.items():
+            comments.sort(key=lambda c: c["created_at"])
+            issues_by_number[number].comments = [c["body"] for c in comments]
+
+        print(f"Fetched comments for {len(comments_by_number)} issues")
+
     async def _cache_issues(self):
         """Cache issues to file"""
         os.makedirs("data", exist_ok=True)
@@ -124,17 +368,46 @@ class GitHubService:
             issues_data.append(issue_dict)
         
         with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(issues_data, f, ensure_ascii=False, indent=2)
+            json.dump(issues_data, f, ensure_ascii=False, separators=(",", ":"))
     
+    def _set_issues(self, issues: List[GitHubIssue]):
+        """Replace the issues cache, computing the search fields at once rather than on the first query"""
+        self.issues_cache = issues
+        self._search_fields()
+
+    def _search_fields(self) -> List[Tuple[GitHubIssue, str, str, float, datetime]]:
+        """Normalized title and body, static boost and end of recency of every issue.
+
+        Computed once per version of the issues cache, which is replaced
+        rather than modified when issues change.
+        """
+        if self._fields_source is not self.issues_cache:
+            fields = []
+            for issue in self.issues_cache:
+                boost = 0.0
+                # Boost closed issues with solutions
+                if issue.state == "closed":
+                    boost += 0.2
+                # Boost issues with certain labels
+                if HELPFUL_LABELS.intersection(issue.labels):
+                    boost += 0.1
+
+                recent_until = issue.updated_at.replace(tzinfo=None) + timedelta(days=RECENT_ISSUE_DAYS)
+                fields.append((issue, normalize_text(issue.title), normalize_text(issue.body), boost, recent_until))
+            self._fields = fields
+            self._fields_source = self.issues_cache
+        return self._fields
+
     async def search_issues(self, query: str, limit: int = 5) -> List[SearchResult]:
         """Search GitHub issues"""
-        query_lower = query.lower()
-        results = []
+        query_normalized = normalize_text(query)
+        now = datetime.now()
+        matches = []
         
-        for issue in self.issues_cache:
+        for issue, title, body, boost, recent_until in self._search_fields():
             # Search in title and body
-            title_match = query_lower in issue.title.lower()
-            body_match = query_lower in issue.body.lower()
+            title_match = query_normalized in title
+            body_match = query_normalized in body
             
             if title_match or body_match:
                 # Calculate relevance score
@@ -143,44 +416,44 @@ class GitHubService:
                     score += 0.8
                 if body_match:
                     score += 0.4
-                
-                # Boost closed issues with solutions
-                if issue.state == "closed":
-                    score += 0.2
-                
-                # Boost issues with certain labels
-                helpful_labels = ["bug", "question", "documentation", "help wanted"]
-                if any(label in helpful_labels for label in issue.labels):
-                    score += 0.1
+                score += boost
                 
                 # Boost recent issues
-                days_old = (datetime.now() - issue.updated_at.replace(tzinfo=None)).days
-                if days_old < 30:
+                if now < recent_until:
                     score += 0.1
-                
-                result = SearchResult(
-                    title=issue.title,
-                    content=issue.body[:400] + "..." if len(issue.body) > 400 else issue.body,
-                    url=issue.url,
-                    source_type=SourceType.GITHUB_ISSUE,
-                    relevance_score=min(score, 1.0),
-                    metadata={
-                        "number": issue.number,
-                        "state": issue.state,
-                        "labels": issue.labels,
-                        "author": issue.author,
-                        "created_at": issue.created_at.isoformat(),
-                        "updated_at": issue.updated_at.isoformat()
-                    }
-                )
-                results.append(result)
+                matches.append((min(score, 1.0), issue))
         
-        # Sort by relevance and return top results
-        results.sort(key=lambda x: x.relevance_score, reverse=True)
-        return results[:limit]
+        # Only the top results are turned into SearchResult objects
+        return [
+            SearchResult(
+                title=issue.title,
+                content=issue.body[:400] + "..." if len(issue.body) > 400 else issue.body,
+                url=issue.url,
+                source_type=SourceType.GITHUB_ISSUE,
+                relevance_score=score,
+                metadata={
+                    "number": issue.number,
+                    "state": issue.state,
+                    "labels": issue.labels,
+                    "author": issue.author,
+                    "created_at": issue.created_at.isoformat(),
+                    "updated_at": issue.updated_at.isoformat()
+                }
+            )
+            for score, issue in heapq.nlargest(limit, matches, key=lambda match: match[0])
+        ]
     
+    @property
+    def can_search_code(self) -> bool:
+        """Whether code search is available: a local index, or a token for GitHub's code search API"""
+        return self.code_index is not None or "Authorization" in self.headers
+
     async def search_code(self, query: str, limit: int = 5) -> List[SearchResult]:
         """Search source code in the repository"""
+        if self.code_index is not None:
+            # BM25 scoring and snippet tokenizing are CPU-bound, keep them off the event loop
+            return await asyncio.to_thread(self._search_local_code, query, limit)
+
         try:
             url = f"{self.base_url}/search/code"
             params = {
@@ -193,14 +466,18 @@ class GitHubService:
             
             data = response.json()
             results = []
+
+            # GitHub scores are unbounded, normalize against the best match like the local index
+            items = data.get("items", [])
+            max_score = max((item.get("score") or 0 for item in items), default=0)
             
-            for item in data.get("items", []):
+            for item in items:
                 result = SearchResult(
                     title=f"{item['name']} - {item['path']}",
                     content=self._extract_code_snippet(item.get("text_matches", [])),
                     url=item["html_url"],
                     source_type=SourceType.SOURCE_CODE,
-                    relevance_score=item.get("score", 0.5),
+                    relevance_score=(item.get("score") or 0) / max_score if max_score > 0 else 0.5,
                     metadata={
                         "file_path": item["path"],
                         "repository": item["repository"]["full_name"],
@@ -215,6 +492,25 @@ class GitHubService:
             print(f"Error searching code: {e}")
             return []
     
+    def _search_local_code(self, query: str, limit: int) -> List[SearchResult]:
+        """Search the local code index, without any network round-trip"""
+        results = []
+        for code, score in self.code_index.search(query, limit):
+            results.append(SearchResult(
+                title=f"{os.path.basename(code.file_path)} - {code.file_path}",
+                content=code.content,
+                url=code.url,
+                source_type=SourceType.SOURCE_CODE,
+                relevance_score=min(score, 1.0),
+                metadata={
+                    "file_path": code.file_path,
+                    "repository": code.repository,
+                    "language": code.language,
+                    "line_numbers": code.line_numbers
+                }
+            ))
+        return results
+
     def _extract_code_snippet(self, text_matches: List[Dict]) -> str:
         """Extract relevant code snippets from search matches"""
         if not text_matches:
@@ -233,8 +529,8 @@ class GitHubService:
         return self.issues_cache[:limit]
     
     async def refresh_issues(self):
-        """Refresh issues cache"""
-        await self._fetch_issues()
+        """Refresh issues cache with the issues changed since the last sync"""
+        await self._sync_issues()
         print("GitHub issues cache refreshed")
     
     async def close(self):
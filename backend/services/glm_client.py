@@ -0,0 +1,205 @@
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+# HTTP/2 multiplexes concurrent completions over a few connections, it needs h2
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Failures before the request reached the server. Anything later (read
+# timeouts, dropped streams) may already have started a billed completion.
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream that keeps failing"""
+
+
+class CircuitBreaker:
+    """Stops calls after `failure_threshold` consecutive failures.
+
+    Every `reset_timeout` seconds a single trial call is let through; its
+    success closes the circuit again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return False
+        # Restart the timer so that only this call goes through
+        self.opened_at = time.monotonic()
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                print(f"GLM API failed {self.failures} times in a row, pausing calls for {self.reset_timeout:.0f}s")
+            self.opened_at = time.monotonic()
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Delay requested by a Retry-After header, in seconds"""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class GLMClient:
+    """HTTP client for the GLM API.
+
+    Caps the number of completions in flight, retries rate limits, server
+    errors and failed connections with jittered exponential backoff (or
+    the delay the server asks for), and trips a circuit breaker when the
+    upstream keeps failing so callers can fall back at once.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        max_concurrency: int = 8,
+        max_connections: int = 20,
+        timeout: float = 60.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        breaker: Optional[CircuitBreaker] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            },
+            timeout=httpx.Timeout(timeout, connect=10.0),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            http2=HTTP2_AVAILABLE and transport is None,
+            transport=transport
+        )
+
+    def _slots(self) -> asyncio.Semaphore:
+        # Created on first use so that it belongs to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _backoff(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """Full-jitter exponential backoff, or the server's Retry-After when given"""
+        if response is not None:
+            retry_after = _retry_after(response)
+            if retry_after is not None:
+                return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _send(self, method: str, path: str, json: Dict[str, Any], stream: bool) -> httpx.Response:
+        """Send with retries, returning the last response received.
+
+        A concurrency slot is held only while an attempt is in flight, not
+        during the backoff. The slot of the returned response is still held,
+        the caller releases it once done with the response.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("GLM API circuit is open")
+
+        slots = self._slots()
+        attempt = 0
+        while True:
+            await slots.acquire()
+            try:
+                response = await self.client.send(self.client.build_request(method, path, json=json), stream=stream)
+            except RETRYABLE_ERRORS as e:
+                slots.release()
+                if attempt >= self.max_retries:
+                    self.breaker.record_failure()
+                    raise
+                delay = self._backoff(attempt)
+                print(f"GLM API request failed ({e!r}), retrying in {delay:.1f}s")
+            except httpx.TransportError:
+                slots.release()
+                self.breaker.record_failure()
+                raise
+            except BaseException:
+                slots.release()
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    self.breaker.record_success()
+                    return response
+                if attempt >= self.max_retries:
+                    self.breaker.record_failure()
+                    return response
+                delay = self._backoff(attempt, response)
+                try:
+                    await response.aclose()
+                finally:
+                    slots.release()
+                print(f"GLM API returned {response.status_code}, retrying in {delay:.1f}s")
+
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def post(self, path: str, json: Dict[str, Any]) -> httpx.Response:
+        """POST and read the whole response"""
+        response = await self._send("POST", path, json, stream=False)
+        self._slots().release()
+        return response
+
+    @asynccontextmanager
+    async def stream(self, method: str, path: str, json: Dict[str, Any]) -> AsyncIterator[httpx.Response]:
+        """Send a request and stream its response.
+
+        Only failures before the body starts are retried, and the concurrency
+        slot is held until the caller is done reading.
+        """
+        response = await self._send(method, path, json, stream=True)
+        try:
+            yield response
+        finally:
+            try:
+                await response.aclose()
+            finally:
+                self._slots().release()
+
+    async def aclose(self):
+        await self.client.aclose()
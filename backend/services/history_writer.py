@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+
+from sqlalchemy import insert
+
+from database import SessionLocal, QuestionHistory
+
+
+class HistoryWriter:
+    """Write-behind buffer for question history.
+
+    Requests only enqueue a row; a background task writes the queued rows with
+    one multi-row INSERT per batch, as soon as `batch_size` rows are waiting
+    or `flush_interval` seconds after the first one arrived.
+    """
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 1.0, max_queue: int = 10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start the background flusher"""
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._task = asyncio.create_task(self._run())
+
+    def record(self, user_id: int, question: str, answer: str, confidence: float, response_time: float):
+        """Queue a history row without waiting for the database"""
+        row = {
+            "user_id": user_id,
+            "question": question,
+            "answer": answer,
+            "confidence": str(confidence),
+            "response_time": str(response_time),
+            "confidence_score": confidence,
+            "response_time_seconds": response_time,
+            # Time of the answer, not of the flush
+            "created_at": datetime.now(timezone.utc)
+        }
+
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            print("Warning: history queue is full, dropping history entry")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            row = await self._queue.get()
+            if row is None:
+                break
+
+            batch = [row]
+            deadline = loop.time() + self.flush_interval
+
+            # Collect until the batch is full or the interval has elapsed
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+
+            await self._flush(batch)
+
+    async def _flush(self, rows: List[Dict[str, Any]]):
+        """Write a batch of rows in a single statement"""
+        try:
+            async with SessionLocal() as db:
+                await db.execute(insert(QuestionHistory), rows)
+                await db.commit()
+        except Exception as e:
+            print(f"Error writing {len(rows)} history entries: {e}")
+
+    async def stop(self):
+        """Flush everything still queued and stop the background flusher"""
+        if not self._task:
+            return
+
+        # The sentinel is queued behind the pending rows, so they are written first
+        await self._queue.put(None)
+        await self._task
+
+        # Rows that arrived after the sentinel
+        remaining = []
+        while not self._queue.empty():
+            row = self._queue.get_nowait()
+            if row is not None:
+                remaining.append(row)
+        for start in range(0, len(remaining), self.batch_size):
+            await self._flush(remaining[start:start + self.batch_size])
+
+        self._task = None
@@ -0,0 +1,237 @@
+"""
+Binary on-disk format of the search index.
+
+The file is memory-mapped on load instead of parsed: postings and document
+lengths are read straight out of the mapping and documents are decoded only
+when a search returns them. Processes that map the same file share its pages
+through the OS page cache rather than each holding a copy of the index.
+
+Layout (little-endian, every section aligned to 8 bytes):
+
+    header          magic, format and tokenizer version, counts, BM25 parameters
+    section table   (offset, length) of each section below
+    doc_offsets     uint64[n_docs + 1]   byte ranges of the documents in doc_blob
+    doc_blob        compact UTF-8 JSON of every document
+    doc_lengths     uint32[n_docs]
+    boosts          float32[n_docs]      static boosts of the documents
+    term_offsets    uint64[n_terms + 1]  byte ranges of the terms in term_blob
+    term_blob       UTF-8 terms sorted by their bytes
+    posting_offsets uint64[n_terms + 1]  ranges of each term in the posting arrays
+    posting_docs    uint32[n_postings]
+    posting_tfs     uint32[n_postings]
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from services.search_index import SearchIndex, TOKENIZER_VERSION
+
+MAGIC = b"XQAIDX\x00\x00"
+FORMAT_VERSION = 2
+
+_HEADER = struct.Struct("<8sIIIIQddd")
+_SECTIONS = (
+    "doc_offsets", "doc_blob", "doc_lengths", "boosts",
+    "term_offsets", "term_blob",
+    "posting_offsets", "posting_docs", "posting_tfs",
+)
+_SECTION_TABLE = struct.Struct("<" + "QQ" * len(_SECTIONS))
+_ALIGNMENT = 8
+
+# Decoded documents kept per index, search results mostly come from a small hot set
+DECODED_CACHE_SIZE = 2048
+
+
+class IndexFormatError(ValueError):
+    """The index file is missing, corrupt or written by an incompatible version"""
+
+
+def _typed(typecode: str, values) -> bytes:
+    data = array(typecode, values)
+    if sys.byteorder != "little":
+        data.byteswap()
+    return data.tobytes()
+
+
+def _blob(items: List[bytes]) -> Tuple[bytes, bytes]:
+    """Concatenate items, returning the offsets section and the blob"""
+    offsets = [0]
+    for item in items:
+        offsets.append(offsets[-1] + len(item))
+    return _typed("Q", offsets), b"".join(items)
+
+
+def write_index(index: SearchIndex, path: str = "data/index.bin"):
+    """Write an in-memory index to `path`, replacing the previous file atomically"""
+    terms = sorted(index.postings, key=lambda term: term.encode("utf-8"))
+
+    posting_offsets = [0]
+    posting_docs = array("I")
+    posting_tfs = array("I")
+    for term in terms:
+        doc_ids, tfs = index.postings[term]
+        posting_docs.extend(doc_ids)
+        posting_tfs.extend(tfs)
+        posting_offsets.append(len(posting_docs))
+    if sys.byteorder != "little":
+        posting_docs.byteswap()
+        posting_tfs.byteswap()
+
+    doc_offsets, doc_blob = _blob([
+        json.dumps(doc, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        for doc in index.documents
+    ])
+    term_offsets, term_blob = _blob([term.encode("utf-8") for term in terms])
+
+    sections = {
+        "doc_offsets": doc_offsets,
+        "doc_blob": doc_blob,
+        "doc_lengths": _typed("I", index.doc_lengths),
+        "boosts": _typed("f", index.boosts),
+        "term_offsets": term_offsets,
+        "term_blob": term_blob,
+        "posting_offsets": _typed("Q", posting_offsets),
+        "posting_docs": posting_docs.tobytes(),
+        "posting_tfs": posting_tfs.tobytes(),
+    }
+
+    header = _HEADER.pack(
+        MAGIC, FORMAT_VERSION, TOKENIZER_VERSION,
+        len(index.documents), len(terms), len(posting_docs),
+        index.avg_doc_length, index.k1, index.b
+    )
+
+    table = []
+    offset = _HEADER.size + _SECTION_TABLE.size
+    for name in _SECTIONS:
+        offset += -offset % _ALIGNMENT
+        table.extend((offset, len(sections[name])))
+        offset += len(sections[name])
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(_SECTION_TABLE.pack(*table))
+        for name in _SECTIONS:
+            f.write(b"\x00" * (-f.tell() % _ALIGNMENT))
+            f.write(sections[name])
+    os.replace(tmp_path, path)
+
+
+class MappedDocuments(Sequence):
+    """Read-only list of documents decoded from the mapping on access.
+
+    Recently read documents are cached decoded; they are shared between
+    callers and must not be modified.
+    """
+
+    def __init__(self, offsets: memoryview, blob: memoryview):
+        self._offsets = offsets
+        self._blob = blob
+        self._decode = lru_cache(maxsize=DECODED_CACHE_SIZE)(self._decode_uncached)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("document index out of range")
+        return self._decode(i)
+
+    def _decode_uncached(self, i: int):
+        return json.loads(self._blob[self._offsets[i]:self._offsets[i + 1]].tobytes().decode("utf-8"))
+
+
+class MappedSearchIndex(SearchIndex):
+    """SearchIndex served from a memory-mapped index file"""
+
+    def __init__(self, buffer: mmap.mmap):
+        view = memoryview(buffer)
+        if len(view) < _HEADER.size + _SECTION_TABLE.size:
+            raise IndexFormatError("index file is truncated")
+
+        (magic, format_version, tokenizer_version, n_docs, n_terms, n_postings,
+         avg_doc_length, k1, b) = _HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise IndexFormatError("not an index file")
+        if format_version != FORMAT_VERSION:
+            raise IndexFormatError(f"index format {format_version}, expected {FORMAT_VERSION}")
+        if tokenizer_version != TOKENIZER_VERSION:
+            raise IndexFormatError(f"index tokenizer {tokenizer_version}, expected {TOKENIZER_VERSION}")
+        if sys.byteorder != "little":
+            raise IndexFormatError("index files can only be mapped on little-endian hosts")
+
+        table = _SECTION_TABLE.unpack_from(view, _HEADER.size)
+        sections: Dict[str, memoryview] = {}
+        for i, name in enumerate(_SECTIONS):
+            offset, length = table[2 * i], table[2 * i + 1]
+            if offset + length > len(view):
+                raise IndexFormatError("index file is truncated")
+            sections[name] = view[offset:offset + length]
+
+        self._buffer = buffer
+        self._term_offsets = sections["term_offsets"].cast("Q")
+        self._term_blob = sections["term_blob"]
+        self._posting_offsets = sections["posting_offsets"].cast("Q")
+        self._posting_docs = sections["posting_docs"].cast("I")
+        self._posting_tfs = sections["posting_tfs"].cast("I")
+        self._n_terms = n_terms
+
+        if (len(self._term_offsets) != n_terms + 1 or len(self._posting_docs) != n_postings
+                or len(sections["doc_lengths"]) != 4 * n_docs
+                or len(sections["boosts"]) != 4 * n_docs):
+            raise IndexFormatError("index sections do not match the header")
+
+        self.documents = MappedDocuments(sections["doc_offsets"].cast("Q"), sections["doc_blob"])
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.doc_lengths = sections["doc_lengths"].cast("I")
+        self.boosts = sections["boosts"].cast("f")
+        self.avg_doc_length = avg_doc_length
+        self.vectors = None
+
+    @classmethod
+    def load(cls, path: str = "data/index.bin") -> Optional["MappedSearchIndex"]:
+        """Map an index file read-only, None if there is none"""
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+
+        with open(path, "rb") as f:
+            # The mapping stays valid after the file is closed or replaced
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer)
+
+    def _term(self, i: int) -> bytes:
+        return self._term_blob[self._term_offsets[i]:self._term_offsets[i + 1]].tobytes()
+
+    def term_postings(self, term: str) -> Tuple[Sequence[int], Sequence[int]]:
+        """Binary search the sorted terms, then slice the posting arrays"""
+        key = term.encode("utf-8")
+        lo, hi = 0, self._n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        if lo == self._n_terms or self._term(lo) != key:
+            return (), ()
+
+        start, end = self._posting_offsets[lo], self._posting_offsets[lo + 1]
+        return self._posting_docs[start:end], self._posting_tfs[start:end]
@@ -0,0 +1,115 @@
+import json
+import os
+from collections import deque
+from typing import List, Dict, Iterable, Iterator, Set, Tuple
+
+from services.search_index import tokenize
+
+DEFAULT_QUERY_EXPANSION_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources", "query_expansion.json"
+)
+
+
+class AhoCorasick:
+    """Finds every occurrence of a set of keywords in one pass over the text"""
+
+    def __init__(self, keywords: Iterable[str]):
+        # Node 0 is the root; goto transitions, failure links and keywords ending at each node
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+
+        for keyword in keywords:
+            self._add(keyword)
+        self._link()
+
+    def _add(self, keyword: str):
+        node = 0
+        for char in keyword:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append(keyword)
+
+    def _link(self):
+        """Breadth-first computation of the failure links"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                # A keyword ending at the failure target also ends here
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find(self, text: str) -> Iterator[Tuple[int, str]]:
+        """(end position, keyword) of every keyword occurrence"""
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for keyword in self._output[node]:
+                yield position, keyword
+
+
+class QueryAnalyzer:
+    """Turns a question into search terms.
+
+    Built once from the query expansion file: Chinese keywords are expanded
+    to their English counterparts, domain questions get the project terms
+    and stopwords are dropped, both from the question and the expansions.
+    """
+
+    def __init__(
+        self,
+        mapping: Dict[str, List[str]],
+        domain_triggers: Iterable[str] = (),
+        domain_terms: Iterable[str] = (),
+        stopwords: Iterable[str] = ()
+    ):
+        self.stopwords: Set[str] = {word.lower() for word in stopwords}
+
+        # Expansions are tokenized once, like the index tokenizes documents
+        self.expansions: Dict[str, List[str]] = {}
+        for keyword, terms in mapping.items():
+            self.expansions[keyword.lower()] = [token for term in terms for token in tokenize(term)]
+
+        self.domain_triggers = {trigger.lower() for trigger in domain_triggers}
+        self.domain_terms = [token for term in domain_terms for token in tokenize(term)]
+
+        self.automaton = AhoCorasick(set(self.expansions) | self.domain_triggers)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_QUERY_EXPANSION_PATH) -> "QueryAnalyzer":
+        """Build the analyzer from a query expansion file"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(
+            data.get("mapping", {}),
+            data.get("domain_triggers", []),
+            data.get("domain_terms", []),
+            data.get("stopwords", [])
+        )
+
+    def analyze(self, query: str) -> List[str]:
+        """Distinct search terms of a query, in order of appearance"""
+        query_lower = query.lower()
+        terms = tokenize(query_lower)
+
+        matched = dict.fromkeys(keyword for _, keyword in self.automaton.find(query_lower))
+        for keyword in matched:
+            terms.extend(self.expansions.get(keyword, ()))
+        if self.domain_triggers.intersection(matched):
+            terms.extend(self.domain_terms)
+
+        return [term for term in dict.fromkeys(terms) if term not in self.stopwords]
@@ -1,11 +1,13 @@
 import asyncio
 import time
 import json
-from typing import List, Optional
+from typing import List, Optional, Dict, Any, AsyncIterator
 import os
-import httpx
 
 from models.schemas import SearchResult, GeneratedAnswer
+from services.answer_cache import AnswerCache
+from services.context_packer import pack_context, format_source
+from services.glm_client import GLMClient, CircuitBreaker, HTTP2_AVAILABLE
 
 class ResponseService:
     def __init__(self):
@@ -13,19 +15,32 @@ class ResponseService:
         self.model = "glm-4.5"  # GLM-4.5 model
         self.base_url = "https://open.bigmodel.cn/api/paas/v4"
 
+        # Approximate tokens of search results put in a prompt
+        self.context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+        # Cache of generated answers, cleared whenever the search index is rebuilt
+        self.answer_cache = AnswerCache(
+            max_size=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+        )
+
         # Initialize GLM API client
         api_key = os.getenv("GLM_API_KEY", "400c9da1294c4b14bbe5e5db27e9a058.C2mJyUDphuVfEGgc")
         if api_key:
             self.api_key = api_key
-            self.client = httpx.AsyncClient(
-                base_url=self.base_url,
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                },
-                timeout=60.0
+            self.client = GLMClient(
+                self.base_url,
+                api_key,
+                max_concurrency=int(os.getenv("GLM_MAX_CONCURRENCY", "8")),
+                max_connections=int(os.getenv("GLM_MAX_CONNECTIONS", "20")),
+                timeout=float(os.getenv("GLM_TIMEOUT_SECONDS", "60")),
+                max_retries=int(os.getenv("GLM_MAX_RETRIES", "3")),
+                breaker=CircuitBreaker(
+                    failure_threshold=int(os.getenv("GLM_CIRCUIT_FAILURE_THRESHOLD", "5")),
+                    reset_timeout=float(os.getenv("GLM_CIRCUIT_RESET_SECONDS", "30"))
+                )
             )
-            print("GLM-4.5 API initialized successfully")
+            print(f"GLM-4.5 API initialized successfully (HTTP/2: {HTTP2_AVAILABLE})")
         else:
             print("Warning: No GLM API key found. Response generation will be limited.")
 
@@ -46,33 +61,14 @@ class ResponseService:
         if not self.client:
             # Fallback to simple response without AI
             return await self._generate_fallback_answer(question, search_results, start_time)
+
+        cache_key = self._cache_key(question, search_results, context)
+        cached = self.answer_cache.get(cache_key)
+        if cached:
+            return cached.copy(update={"response_time": time.time() - start_time})
         
         try:
-            # Prepare context from search results
-            context_text = self._prepare_context(search_results)
-
-            # Create the prompt
-            prompt = self._create_prompt(question, context_text, context)
-
-            # Generate response using GLM API
-            payload = {
-                "model": self.model,
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": self._get_system_prompt()
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "max_tokens": 1000,
-                "temperature": 0.3,
-                "thinking": {
-                    "type": "enabled"  # Enable GLM-4.5 thinking mode for better reasoning
-                }
-            }
+            payload = self._build_payload(question, search_results, context)
 
             response = await self.client.post("/chat/completions", json=payload)
             response.raise_for_status()
@@ -81,16 +77,148 @@ class ResponseService:
             answer_content = response_data["choices"][0]["message"]["content"]
             confidence = self._calculate_confidence(search_results, answer_content)
 
-            return GeneratedAnswer(
+            answer = GeneratedAnswer(
                 content=answer_content,
                 confidence=confidence,
                 response_time=time.time() - start_time,
                 reasoning=f"Generated from {len(search_results)} sources using GLM-4.5"
             )
+            self.answer_cache.set(cache_key, answer)
+            return answer
             
         except Exception as e:
             print(f"Error generating AI response: {e}")
             return await self._generate_fallback_answer(question, search_results, start_time)
+
+    async def stream_answer(
+        self,
+        question: str,
+        search_results: List[SearchResult],
+        context: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Generate an answer incrementally.
+
+        Yields ``{"type": "token", "content": ...}`` events as the model produces
+        them, followed by a single ``{"type": "done", ...}`` event carrying the
+        confidence and response time of the complete answer.
+        """
+        start_time = time.time()
+        answer_parts = []
+
+        completed = False
+        cache_key = self._cache_key(question, search_results, context)
+        cached = self.answer_cache.get(cache_key) if self.client else None
+        if cached:
+            yield {"type": "token", "content": cached.content}
+            yield {
+                "type": "done",
+                "confidence": cached.confidence,
+                "response_time": time.time() - start_time
+            }
+            return
+
+        if self.client:
+            try:
+                payload = self._build_payload(question, search_results, context)
+                payload["stream"] = True
+
+                async with self.client.stream("POST", "/chat/completions", json=payload) as response:
+                    response.raise_for_status()
+
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            completed = True
+                            break
+
+                        choices = json.loads(data).get("choices") or []
+                        # Thinking mode also streams reasoning_content, only the answer is relayed
+                        token = choices[0].get("delta", {}).get("content") if choices else None
+                        if token:
+                            answer_parts.append(token)
+                            yield {"type": "token", "content": token}
+
+            except Exception as e:
+                print(f"Error streaming AI response: {e}")
+                # Tokens already sent cannot be taken back, only fall back if nothing was sent
+                if answer_parts:
+                    yield {"type": "error", "detail": "Answer generation was interrupted"}
+
+        if not answer_parts:
+            fallback = await self._generate_fallback_answer(question, search_results, start_time)
+            yield {"type": "token", "content": fallback.content}
+            yield {
+                "type": "done",
+                "confidence": fallback.confidence,
+                "response_time": time.time() - start_time
+            }
+            return
+
+        answer_content = "".join(answer_parts)
+        answer = GeneratedAnswer(
+            content=answer_content,
+            confidence=self._calculate_confidence(search_results, answer_content),
+            response_time=time.time() - start_time,
+            reasoning=f"Generated from {len(search_results)} sources using GLM-4.5"
+        )
+
+        # Interrupted answers are not worth serving again
+        if completed:
+            self.answer_cache.set(cache_key, answer)
+
+        yield {
+            "type": "done",
+            "confidence": answer.confidence,
+            "response_time": answer.response_time
+        }
+
+    def _cache_key(
+        self,
+        question: str,
+        search_results: List[SearchResult],
+        context: Optional[str] = None
+    ) -> str:
+        """Cache key of an answer: question, language and the sources it is based on"""
+        return AnswerCache.make_key(
+            question,
+            self._detect_language(question),
+            [result.url for result in search_results],
+            context
+        )
+
+    def _build_payload(
+        self,
+        question: str,
+        search_results: List[SearchResult],
+        context: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Build the chat completion request for a question"""
+        # Prepare context from search results
+        context_text = self._prepare_context(search_results)
+
+        # Create the prompt
+        prompt = self._create_prompt(question, context_text, context)
+
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": self._get_system_prompt()
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "max_tokens": 1000,
+            "temperature": 0.3,
+            "thinking": {
+                "type": "enabled"  # Enable GLM-4.5 thinking mode for better reasoning
+            }
+        }
     
     def _get_system_prompt(self) -> str:
         """Get the system prompt for the AI assistant"""
@@ -187,23 +315,12 @@ Remember: Xinference supports multiple backends (vLLM, llama.cpp, Transformers,
         return "\n".join(prompt_parts)
     
     def _prepare_context(self, search_results: List[SearchResult]) -> str:
-        """Prepare context text from search results"""
+        """Prepare context text from the search results that fit the token budget"""
         if not search_results:
             return "No relevant context found."
-        
-        context_parts = []
-        
-        for i, result in enumerate(search_results[:5], 1):  # Limit to top 5 results
-            source_type = result.source_type.value.replace("_", " ").title()
-            context_parts.append(
-                f"Source {i} ({source_type}):\n"
-                f"Title: {result.title}\n"
-                f"Content: {result.content}\n"
-                f"URL: {result.url}\n"
-                f"Relevance: {result.relevance_score:.2f}\n"
-            )
-        
-        return "\n---\n".join(context_parts)
+
+        packed = pack_context(search_results, self.context_token_budget)
+        return "\n---\n".join(format_source(i, result) for i, result in enumerate(packed, 1))
     
     def _calculate_confidence(self, search_results: List[SearchResult], answer: str) -> float:
         """Calculate confidence score for the generated answer"""
@@ -0,0 +1,148 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import List, Dict, Any, Iterable, Sequence, Tuple
+
+# Title terms are counted several times so that a match in the title
+# outweighs the same match buried in the body
+TITLE_WEIGHT = 3
+
+# Bump whenever tokenize or TITLE_WEIGHT change, persisted indexes are then rebuilt
+TOKENIZER_VERSION = 3
+
+_CJK = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+# Runs of Chinese characters, and words of everything else
+_TOKEN_PATTERN = re.compile(f'[{_CJK}]+|[^\\W{_CJK}]+')
+_CJK_CHAR = re.compile(f'[{_CJK}]')
+
+
+def normalize_text(text: str) -> str:
+    """Casefolded NFKC form of a text, full-width letters and digits become ASCII"""
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase word tokens.
+
+    Chinese has no spaces between words, so runs of Chinese characters are
+    cut into overlapping bigrams, which match words of any length without a
+    dictionary.
+    """
+    if not text:
+        return []
+
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(normalize_text(text)):
+        if len(token) > 1 and _CJK_CHAR.match(token):
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def document_terms(doc: Dict[str, Any]) -> Counter:
+    """Term frequencies of a document, title terms weighted by TITLE_WEIGHT"""
+    term_counts = Counter(tokenize(doc.get('content', '')))
+    for term in tokenize(doc.get('title', '')):
+        term_counts[term] += TITLE_WEIGHT
+    return term_counts
+
+
+class SearchIndex:
+    """Inverted index over a list of documents with BM25 ranking"""
+
+    def __init__(
+        self,
+        documents: List[Dict[str, Any]] = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+        term_counts: List[Counter] = None,
+        boosts: List[float] = None
+    ):
+        self.documents = documents or []
+        self.k1 = k1
+        self.b = b
+        # term -> (document ids, term frequencies), both in document order
+        self.postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self.doc_lengths: Sequence[int] = []
+        self.avg_doc_length = 0.0
+
+        # Query-independent score of each document, computed when it is indexed
+        self.boosts: Sequence[float] = boosts or [0.0] * len(self.documents)
+
+        # Optional dense vectors of the same documents, see services.vector_index
+        self.vectors = None
+
+        self._build(term_counts)
+
+    def _build(self, all_term_counts: List[Counter] = None):
+        """Build the postings lists, tokenizing the documents without precomputed term counts"""
+        postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        doc_lengths = []
+
+        for doc_id, doc in enumerate(self.documents):
+            term_counts = all_term_counts[doc_id] if all_term_counts else document_terms(doc)
+
+            doc_lengths.append(sum(term_counts.values()))
+            for term, tf in term_counts.items():
+                doc_ids, tfs = postings.setdefault(term, ([], []))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.avg_doc_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def term_postings(self, term: str) -> Tuple[Sequence[int], Sequence[int]]:
+        """Document ids and term frequencies of the documents containing a term"""
+        return self.postings.get(term, ((), ()))
+
+    def idf(self, term: str, df: int) -> float:
+        """Inverse document frequency of a term (BM25 variant, always positive)"""
+        n = len(self.documents)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, terms: Iterable[str]) -> Dict[int, float]:
+        """Score the documents containing any of the terms.
+
+        Only the postings of the query terms are visited, so the cost depends
+        on how common the terms are rather than on the size of the corpus.
+        """
+        scores: Dict[int, float] = {}
+        if not self.documents or self.avg_doc_length == 0:
+            return scores
+
+        k1 = self.k1
+        b = self.b
+        avg_doc_length = self.avg_doc_length
+        doc_lengths = self.doc_lengths
+
+        for term in set(terms):
+            doc_ids, tfs = self.term_postings(term)
+            if not doc_ids:
+                continue
+
+            idf = self.idf(term, len(doc_ids))
+            for doc_id, tf in zip(doc_ids, tfs):
+                norm = k1 * (1 - b + b * doc_lengths[doc_id] / avg_doc_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+
+        return scores
+
+    def score_ceiling(self, terms: Iterable[str]) -> float:
+        """Score no document can reach for these terms.
+
+        Each term adds at most idf * (k1 + 1), whatever its frequency, so
+        dividing by this gives a score that does not depend on the other
+        matches of the query.
+        """
+        ceiling = 0.0
+        for term in set(terms):
+            df = len(self.term_postings(term)[0])
+            if df:
+                ceiling += self.idf(term, df) * (self.k1 + 1)
+        return ceiling
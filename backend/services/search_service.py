@@ -1,25 +1,95 @@
 import asyncio
-from typing import List, Dict, Any
+import heapq
+from collections import Counter
+from typing import List, Dict, Any, Callable, Iterable, Optional, Set, Tuple
 import json
 import os
 from datetime import datetime, timedelta
-import re
 
-from models.schemas import SearchResult, SourceType, PopularQuestion
+from models.schemas import SearchResult, SourceType, PopularQuestion, GitHubIssue
 from services.documentation_service import DocumentationService
 from services.github_service import GitHubService
+from services.search_index import SearchIndex, document_terms, normalize_text
+from services.query_analyzer import QueryAnalyzer, DEFAULT_QUERY_EXPANSION_PATH
+from services.index_store import MappedSearchIndex, IndexFormatError, write_index
+from services.chunking import chunk_documentation_page, chunk_github_issue
+from services.vector_index import Embedder, VectorIndex, reciprocal_rank_fusion, DEFAULT_EMBEDDING_MODEL
+
+# Optional dense retrieval fused with the lexical ranking
+ENABLE_DENSE_RETRIEVAL = os.getenv("ENABLE_DENSE_RETRIEVAL", "false").lower() == "true"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+DENSE_TOP_K = 50
+
+INDEX_PATH = "data/index.bin"
+# Fingerprints of the sources the persisted index was built from
+INDEX_SOURCES_PATH = "data/index_sources.json"
+# Written by earlier versions, migrated to INDEX_PATH on first start
+LEGACY_DOCUMENTS_PATH = "data/documents.json"
+
+SETUP_TERMS = ("install", "setup", "getting started")
+
+# Deadlines of the retrievers run for a question; a retriever that misses
+# its deadline is left out of the answer
+SEARCH_INDEX_TIMEOUT_SECONDS = float(os.getenv("SEARCH_INDEX_TIMEOUT_SECONDS", "2"))
+SEARCH_CODE_TIMEOUT_SECONDS = float(os.getenv("SEARCH_CODE_TIMEOUT_SECONDS", "3"))
+
+# Sources held in the combined index, source code is searched separately
+INDEX_SOURCE_TYPES = {SourceType.DOCUMENTATION, SourceType.GITHUB_ISSUE}
+
+# Share of the relevance given to the match score in the combined index
+MATCH_SCORE_WEIGHT = 0.7
+
+
+def source_fingerprint(source) -> str:
+    """Changes whenever a page or an issue has to be chunked again.
+
+    Pages get a new `last_updated` only when they are parsed again, and an
+    issue's `updated_at` moves with every edit or comment.
+    """
+    if isinstance(source, GitHubIssue):
+        return f"{source.updated_at.isoformat()}|{len(source.comments)}"
+    return source.last_updated.isoformat()
+
+
+def passage_boost(doc: Dict[str, Any]) -> float:
+    """Query-independent part of a passage's score, computed when it is indexed"""
+    boost = 0.0
+
+    # Boost score for certain source types
+    if doc['source_type'] == SourceType.DOCUMENTATION.value:
+        boost += 0.2
+
+    # Boost score for installation/setup related content
+    content = normalize_text(doc.get('content', ''))
+    if any(term in content for term in SETUP_TERMS):
+        boost += 0.1
+
+    return boost
+
 
 class SearchService:
     def __init__(self, doc_service=None, github_service=None):
-        self.documents = []
+        self.index = SearchIndex()
+        self._update_lock = None
+        self._index_listeners: List[Callable[[], None]] = []
         self.doc_service = doc_service or DocumentationService()
         self.github_service = github_service or GitHubService()
+        self.embedder = None
+        # Built once, query analysis is then a single pass over the query
+        self.query_analyzer = QueryAnalyzer.load(os.getenv("QUERY_EXPANSION_PATH", DEFAULT_QUERY_EXPANSION_PATH))
+        # Source key -> (source object, its passages, their term counts and boosts) of the last build
+        self._passages: Dict[str, Tuple[Any, List[Dict[str, Any]], List[Counter], List[float]]] = {}
+        # Source key -> fingerprint of the sources of the current index, persisted with it
+        self._fingerprints: Dict[str, str] = {}
         self.popular_questions = []
 
     async def initialize(self):
         """Initialize the search service"""
         print("Initializing search service...")
 
+        if ENABLE_DENSE_RETRIEVAL and self.embedder is None:
+            await self._load_embedder()
+
         # Load or create document index
         await self._load_or_create_index()
 
@@ -27,209 +97,364 @@ class SearchService:
         await self._load_popular_questions()
 
         print("Search service initialized successfully")
+
+    async def _load_embedder(self):
+        """Load the local embedding model used for dense retrieval"""
+        try:
+            self.embedder = await asyncio.to_thread(Embedder, EMBEDDING_MODEL)
+            print(f"Loaded embedding model {EMBEDDING_MODEL}")
+        except ImportError:
+            print("Warning: dense retrieval needs numpy and sentence-transformers, using lexical search only")
+        except Exception as e:
+            print(f"Error loading embedding model {EMBEDDING_MODEL}: {e}")
+
+    def add_index_listener(self, callback: Callable[[], None]):
+        """Register a callback run every time a rebuilt index is swapped in"""
+        self._index_listeners.append(callback)
+
+    @property
+    def documents(self) -> List[Dict[str, Any]]:
+        """Documents of the current index"""
+        return self.index.documents
     
     async def _load_or_create_index(self):
-        """Load existing index or create new one"""
-        docs_path = "data/documents.json"
-
-        if os.path.exists(docs_path):
-            # Load existing index
-            with open(docs_path, 'r', encoding='utf-8') as f:
-                self.documents = json.load(f)
-            print(f"Loaded existing index with {len(self.documents)} documents")
-
-            # If index is empty, recreate it
-            if len(self.documents) == 0:
-                print("Index is empty, recreating...")
-                await self._create_index()
-        else:
-            # Create new index
+        """Map the persisted index, migrate a legacy one or create a new one"""
+        index = None
+        try:
+            index = await asyncio.to_thread(MappedSearchIndex.load, INDEX_PATH)
+        except (IndexFormatError, OSError) as e:
+            print(f"Persisted index is unusable ({e}), recreating...")
+
+        if index is None and os.path.exists(LEGACY_DOCUMENTS_PATH):
+            index = await asyncio.to_thread(self._migrate_legacy_index)
+
+        if index is None:
             await self._create_index()
-    
+            return
+
+        self.index = index
+        self._fingerprints = self._load_fingerprints()
+        print(f"Loaded existing index with {len(self.documents)} documents")
+
+        # If index is empty, recreate it
+        if len(self.documents) == 0:
+            print("Index is empty, recreating...")
+            await self._create_index()
+        elif self.embedder:
+            await self._attach_vectors(self.index)
+
+    async def reload_index(self) -> bool:
+        """Map the index file as written by another process, without rebuilding it.
+
+        Keeps the current index when the file is missing or unusable.
+        """
+        try:
+            index = await asyncio.to_thread(MappedSearchIndex.load, INDEX_PATH)
+        except (IndexFormatError, OSError) as e:
+            print(f"Persisted index is unusable ({e}), keeping the current one")
+            return False
+        if index is None:
+            return False
+
+        if self.embedder:
+            await self._attach_vectors(index)
+
+        self.index = index
+        self._fingerprints = self._load_fingerprints()
+        for listener in self._index_listeners:
+            listener()
+
+        print(f"Reloaded index with {len(index)} passages")
+        return True
+
+    def _load_fingerprints(self) -> Dict[str, str]:
+        """Source fingerprints of the persisted index, empty if unknown"""
+        if not os.path.exists(INDEX_SOURCES_PATH):
+            return {}
+        try:
+            with open(INDEX_SOURCES_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading index source fingerprints: {e}")
+            return {}
+
+    def _save_fingerprints(self):
+        tmp_path = INDEX_SOURCES_PATH + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._fingerprints, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, INDEX_SOURCES_PATH)
+
+    def _migrate_legacy_index(self):
+        """Convert documents.json into the binary index, None if it has to be rebuilt"""
+        with open(LEGACY_DOCUMENTS_PATH, 'r', encoding='utf-8') as f:
+            documents = json.load(f)
+
+        # Indexes saved before passage chunking hold whole pages
+        if documents and 'id' not in documents[0]:
+            print("Index predates passage chunking, recreating...")
+            return None
+
+        print("Migrating documents.json to the binary index format...")
+        return self._save_index(SearchIndex(documents, boosts=[passage_boost(doc) for doc in documents]))
+
+    async def _attach_vectors(self, index: SearchIndex):
+        """Attach the persisted vectors of a loaded index, embedding what is missing"""
+        vectors = await asyncio.to_thread(VectorIndex.load)
+        if (vectors is not None and vectors.model_name == self.embedder.model_name
+                and await asyncio.to_thread(vectors.matches, index.documents)):
+            index.vectors = vectors
+            print(f"Loaded {len(vectors.ids)} passage embeddings")
+            return
+
+        index.vectors = await asyncio.to_thread(VectorIndex.build, index.documents, self.embedder, vectors)
+        await asyncio.to_thread(index.vectors.save)
+
     async def _create_index(self):
-        """Create new search index from all sources"""
+        """Create new search index from all sources and swap it in"""
         print("Creating new search index...")
 
-        # Collect documents from all sources
+        # Snapshot the source lists, the services replace them rather than mutate them
+        doc_pages = getattr(self.doc_service, 'pages', None) or []
+        issues = getattr(self.github_service, 'issues_cache', None) or []
+
+        # Build off the event loop so requests keep being served from the current index
+        new_index = await asyncio.to_thread(self._build_index, doc_pages, issues)
+        if new_index is None:
+            print("Sources unchanged, keeping the current index")
+            return
+        new_index = await asyncio.to_thread(self._save_index, new_index)
+
+        # A single reference assignment, searches see either the old or the new index
+        self.index = new_index
+        for listener in self._index_listeners:
+            listener()
+
+        print(f"Created index with {len(new_index)} passages")
+
+    def _build_index(self, doc_pages, issues) -> Optional[SearchIndex]:
+        """Chunk all sources into passages and build a search index over them.
+
+        Pages and issues that are the same objects as in the previous build
+        reuse their passages, term counts and boosts, so only changed sources are
+        chunked and tokenized again. Returns None when nothing changed, which
+        after a restart is told by the fingerprints persisted with the index.
+        """
         all_docs = []
+        all_terms = []
+        all_boosts = []
+        passages = {}
+        rebuilt = 0
+
+        sources = [(f"doc:{page.url}", page, chunk_documentation_page) for page in doc_pages]
+        sources += [(f"issue:{issue.number}", issue, chunk_github_issue) for issue in issues]
 
-        # Get documentation - check if service has pages
-        if hasattr(self.doc_service, 'pages') and self.doc_service.pages:
-            doc_pages = self.doc_service.pages
+        fingerprints = {key: source_fingerprint(source) for key, source, _ in sources}
+        if fingerprints == self._fingerprints and len(self.index):
+            return None
+
+        if doc_pages:
             print(f"Found {len(doc_pages)} documentation pages")
-            for page in doc_pages:
-                all_docs.append({
-                    'title': page.title,
-                    'content': page.content,
-                    'url': page.url,
-                    'source_type': SourceType.DOCUMENTATION.value,
-                    'metadata': {'section': page.section}
-                })
         else:
             print("No documentation pages found or service not initialized")
-
-        # Get GitHub issues - check if service has issues
-        if hasattr(self.github_service, 'issues_cache') and self.github_service.issues_cache:
-            issues = self.github_service.issues_cache[:100]  # Limit to first 100
+        if issues:
             print(f"Found {len(issues)} GitHub issues")
-            for issue in issues:
-                all_docs.append({
-                    'title': issue.title,
-                    'content': issue.body,
-                    'url': issue.url,
-                    'source_type': SourceType.GITHUB_ISSUE.value,
-                    'metadata': {
-                        'number': issue.number,
-                        'state': issue.state,
-                        'labels': issue.labels,
-                        'author': issue.author
-                    }
-                })
         else:
             print("No GitHub issues found or service not initialized")
 
-        self.documents = all_docs
-
-        # Save documents
-        os.makedirs("data", exist_ok=True)
-        with open("data/documents.json", 'w', encoding='utf-8') as f:
-            json.dump(self.documents, f, ensure_ascii=False, indent=2)
-
-        print(f"Created index with {len(all_docs)} documents")
+        for key, source, chunker in sources:
+            cached = self._passages.get(key)
+            if cached is None or cached[0] is not source:
+                chunks = chunker(source)
+                cached = (
+                    source,
+                    chunks,
+                    [document_terms(chunk) for chunk in chunks],
+                    [passage_boost(chunk) for chunk in chunks]
+                )
+                rebuilt += 1
+
+            passages[key] = cached
+            all_docs.extend(cached[1])
+            all_terms.extend(cached[2])
+            all_boosts.extend(cached[3])
+
+        if not rebuilt and passages.keys() == self._passages.keys() and len(self.index):
+            return None
+
+        print(f"Chunked {rebuilt} changed sources, reused {len(sources) - rebuilt}")
+        self._passages = passages
+        self._fingerprints = fingerprints
+
+        index = SearchIndex(all_docs, term_counts=all_terms, boosts=all_boosts)
+
+        # Unchanged passages keep the vectors of the current index
+        if self.embedder:
+            index.vectors = VectorIndex.build(all_docs, self.embedder, self.index.vectors)
+
+        return index
+
+    def _save_index(self, index: SearchIndex) -> SearchIndex:
+        """Persist the index and vectors, returning the index mapped back from disk.
+
+        Serving from the mapping lets every worker process share the same
+        pages instead of each holding the postings as Python objects.
+        """
+        try:
+            write_index(index, INDEX_PATH)
+            self._save_fingerprints()
+            mapped = MappedSearchIndex.load(INDEX_PATH)
+        except (IndexFormatError, OSError) as e:
+            print(f"Error saving index: {e}")
+            return index
+
+        mapped.vectors = index.vectors
+        if index.vectors is not None:
+            index.vectors.save()
+        return mapped
     
-    def _get_search_keywords(self, query: str) -> List[str]:
-        """Extract and expand search keywords with Chinese-English mapping"""
-        # Chinese to English keyword mapping for Xinference
-        keyword_mapping = {
-            # Installation related
-            "安装": ["install", "installation", "setup"],
-            "部署": ["deploy", "deployment", "setup"],
-            "配置": ["config", "configuration", "configure"],
-            "启动": ["start", "launch", "run"],
-            "运行": ["run", "running", "execute"],
-
-            # Model related
-            "模型": ["model", "models"],
-            "大模型": ["llm", "large language model"],
-            "语言模型": ["language model", "llm"],
-            "嵌入模型": ["embedding", "embedding model"],
-            "图像模型": ["image", "image model"],
-            "多模态": ["multimodal", "multi-modal"],
-
-            # Technical terms
-            "推理": ["inference", "infer"],
-            "服务": ["service", "server", "serving"],
-            "客户端": ["client"],
-            "API": ["api"],
-            "接口": ["interface", "api"],
-            "后端": ["backend"],
-            "引擎": ["engine"],
-
-            # Common operations
-            "使用": ["use", "using", "usage"],
-            "如何": ["how", "how to"],
-            "什么": ["what", "what is"],
-            "为什么": ["why"],
-            "问题": ["problem", "issue", "error"],
-            "错误": ["error", "bug", "issue"],
-            "故障": ["troubleshoot", "problem", "issue"],
-
-            # Specific backends
-            "vllm": ["vllm"],
-            "transformers": ["transformers"],
-            "llama.cpp": ["llama.cpp", "llamacpp"],
-            "docker": ["docker"],
-            "kubernetes": ["kubernetes", "k8s"],
-        }
-
-        # Extract keywords from query
-        keywords = []
-        query_lower = query.lower()
-
-        # Add original query terms
-        original_terms = re.findall(r'\w+', query_lower)
-        keywords.extend(original_terms)
-
-        # Add mapped English terms for Chinese keywords
-        for chinese_term, english_terms in keyword_mapping.items():
-            if chinese_term in query_lower:
-                keywords.extend(english_terms)
-
-        # Add common Xinference terms if query seems related
-        xinference_terms = ["xinference", "xorbits", "inference"]
-        if any(term in query_lower for term in ["xinference", "推理", "模型", "安装", "部署"]):
-            keywords.extend(xinference_terms)
-
-        return list(set(keywords))  # Remove duplicates
-
-    async def search_all_sources(self, query: str, max_results: int = 10) -> List[SearchResult]:
-        """Search across all sources using enhanced text matching with Chinese support"""
-        if not self.documents:
+    async def search(
+        self,
+        query: str,
+        max_results: int = 10,
+        include_sources: Optional[Iterable[SourceType]] = None
+    ) -> List[SearchResult]:
+        """Search the requested sources concurrently and merge their results.
+
+        The combined index and the code search run side by side, each under
+        its own deadline; sources that were not requested are not searched.
+        """
+        sources = set(include_sources) if include_sources is not None else set(SourceType)
+
+        retrievers = []
+        index_sources = sources & INDEX_SOURCE_TYPES
+        # Checked up front, a missing index is an error rather than a source without results
+        if index_sources and not self.index.documents:
+            raise RuntimeError("Search service not initialized")
+        if index_sources:
+            retrievers.append((
+                "index",
+                self.search_all_sources(
+                    query, max_results, index_sources if index_sources != INDEX_SOURCE_TYPES else None
+                ),
+                SEARCH_INDEX_TIMEOUT_SECONDS
+            ))
+        # Without a local index or a token, GitHub's code search would only fail slowly
+        if SourceType.SOURCE_CODE in sources and self.github_service.can_search_code:
+            retrievers.append((
+                "code",
+                self.github_service.search_code(query, max_results),
+                SEARCH_CODE_TIMEOUT_SECONDS
+            ))
+
+        result_lists = await asyncio.gather(
+            *(self._with_deadline(name, retrieval, timeout) for name, retrieval, timeout in retrievers)
+        )
+
+        # Scores of different sources are not comparable, so the sources are
+        # merged by rank: each source type is one ranking, fused like the
+        # dense and lexical rankings. A result keeps its own relevance score.
+        rankings: Dict[SourceType, Dict[str, float]] = {}
+        by_url: Dict[str, SearchResult] = {}
+        for results in result_lists:
+            for result in results:
+                ranking = rankings.setdefault(result.source_type, {})
+                if result.url not in ranking or ranking[result.url] < result.relevance_score:
+                    ranking[result.url] = result.relevance_score
+                    by_url[result.url] = result
+
+        fused = reciprocal_rank_fusion(list(rankings.values()))
+        return [by_url[url] for url in heapq.nlargest(max_results, fused, key=fused.get)]
+
+    async def _with_deadline(self, name: str, retrieval, timeout: float) -> List[SearchResult]:
+        """Await a retriever, giving up on it after `timeout` seconds"""
+        try:
+            return await asyncio.wait_for(retrieval, timeout)
+        except asyncio.TimeoutError:
+            print(f"Search of {name} missed its {timeout:g}s deadline, answering without it")
+        except Exception as e:
+            print(f"Error searching {name}: {e}")
+        return []
+
+    async def search_all_sources(
+        self,
+        query: str,
+        max_results: int = 10,
+        source_types: Optional[Set[SourceType]] = None
+    ) -> List[SearchResult]:
+        """Search the combined index using BM25 ranking with Chinese keyword expansion.
+
+        `source_types` restricts the results to some of the indexed sources.
+        """
+        index = self.index
+        if not index.documents:
             raise RuntimeError("Search service not initialized")
 
-        # Get expanded keywords including Chinese-English mapping
-        search_keywords = self._get_search_keywords(query)
-        results = []
+        # Query terms including the Chinese-English expansions
+        query_terms = self.query_analyzer.analyze(query)
 
-        print(f"Searching {len(self.documents)} documents for: {query}")
-        print(f"Expanded keywords: {search_keywords}")
-
-        for doc in self.documents:
-            # Enhanced text matching with keyword expansion
-            title_lower = doc['title'].lower()
-            content_lower = doc['content'].lower()
-
-            title_matches = sum(1 for keyword in search_keywords if keyword in title_lower)
-            content_matches = sum(1 for keyword in search_keywords if keyword in content_lower)
-
-            # Also check for partial matches and common patterns
-            partial_matches = 0
-            for keyword in search_keywords:
-                if len(keyword) > 3:  # Only check partial matches for longer keywords
-                    if any(keyword[:4] in text for text in [title_lower, content_lower]):
-                        partial_matches += 0.5
-
-            total_matches = title_matches + content_matches + partial_matches
-
-            if total_matches > 0:
-                # Calculate relevance score based on matches
-                score = 0.0
-                if title_matches > 0:
-                    score += 0.7 * (title_matches / len(search_keywords))
-                if content_matches > 0:
-                    score += 0.3 * (content_matches / len(search_keywords))
-                if partial_matches > 0:
-                    score += 0.1 * (partial_matches / len(search_keywords))
-
-                # Boost score for certain source types
-                if doc['source_type'] == SourceType.DOCUMENTATION.value:
-                    score += 0.2
-
-                # Boost score for installation/setup related content
-                if any(term in content_lower for term in ["install", "setup", "getting started"]):
-                    score += 0.1
-
-                result = SearchResult(
-                    title=doc['title'],
-                    content=doc['content'][:500] + "..." if len(doc['content']) > 500 else doc['content'],
-                    url=doc['url'],
-                    source_type=SourceType(doc['source_type']),
-                    relevance_score=min(score, 1.0),
-                    metadata=doc['metadata']
-                )
-                results.append(result)
+        print(f"Searching {len(index)} documents for: {query}")
+        print(f"Expanded keywords: {query_terms}")
+
+        # Only the postings of the query terms are visited. Scoring runs in a
+        # thread so that the event loop stays free and the deadline can fire
+        scores = await asyncio.to_thread(index.search, query_terms)
+
+        # Paraphrases and untranslated Chinese are caught by the dense ranking
+        if index.vectors is not None and self.embedder:
+            query_vectors = await asyncio.to_thread(self.embedder.encode, [query])
+            dense_scores = dict(index.vectors.search(query_vectors, DENSE_TOP_K)[0])
+            scores = reciprocal_rank_fusion([scores, dense_scores])
 
-        print(f"Found {len(results)} matching documents")
+        if not scores:
+            print("Found 0 matching documents")
+            return []
 
-        # Sort by relevance and return top results
-        results.sort(key=lambda x: x.relevance_score, reverse=True)
-        return results[:max_results]
+        max_score = max(scores.values())
+        boosts = index.boosts
+
+        # Score as plain tuples; documents are only read for the passages popped off the heap.
+        # Normalize against the best match so scores stay in [0, 1]
+        ranked = [
+            (-min(MATCH_SCORE_WEIGHT * (match_score / max_score) + boosts[doc_id], 1.0), doc_id)
+            for doc_id, match_score in scores.items()
+        ]
+        heapq.heapify(ranked)
+
+        results = []
+        seen_parents = set()
+
+        # Each page or issue is represented by its best passage
+        while ranked and len(results) < max_results:
+            neg_score, doc_id = heapq.heappop(ranked)
+            doc = index.documents[doc_id]
+            if source_types is not None and SourceType(doc['source_type']) not in source_types:
+                continue
+
+            parent = doc.get('parent', doc['url'])
+            if parent in seen_parents:
+                continue
+            seen_parents.add(parent)
+
+            metadata = dict(doc['metadata'])
+            if 'id' in doc:
+                metadata['passage_id'] = doc['id']
+
+            result = SearchResult(
+                title=doc['title'],
+                content=doc['content'][:500] + "..." if len(doc['content']) > 500 else doc['content'],
+                url=doc['url'],
+                source_type=SourceType(doc['source_type']),
+                relevance_score=-neg_score,
+                metadata=metadata
+            )
+            results.append(result)
+
+        print(f"Found {len(scores)} matching passages")
+        return results
     
     async def search_by_source(self, query: str, source_type: SourceType, limit: int = 5) -> List[SearchResult]:
         """Search within a specific source type"""
-        all_results = await self.search_all_sources(query, limit * 3)
-        filtered_results = [r for r in all_results if r.source_type == source_type]
-        return filtered_results[:limit]
+        return await self.search(query, limit, [source_type])
     
     async def _load_popular_questions(self):
         """Load popular questions from storage"""
@@ -274,5 +499,33 @@ class SearchService:
     
     async def update_index(self):
         """Update the search index with new content"""
-        await self._create_index()
+        # Created lazily so the lock belongs to the server's event loop
+        if self._update_lock is None:
+            self._update_lock = asyncio.Lock()
+
+        # Only one rebuild at a time, searches are never blocked by it
+        async with self._update_lock:
+            await self._create_index()
         print("Search index updated successfully")
+
+    async def refresh_periodically(self, interval: float, doc_interval: float):
+        """Refresh the sources and rebuild the index in the background.
+
+        GitHub issues are synced every `interval` seconds and the documentation
+        is re-scraped every `doc_interval` seconds. Runs until cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        last_doc_refresh = loop.time()
+
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.github_service.refresh_issues()
+
+                if loop.time() - last_doc_refresh >= doc_interval:
+                    await self.doc_service.refresh_documentation()
+                    last_doc_refresh = loop.time()
+
+                await self.update_index()
+            except Exception as e:
+                print(f"Error refreshing search index: {e}")
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+from typing import List, Dict, Any, Optional, Tuple
+
+# Dense retrieval is optional, it needs numpy and sentence-transformers
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+# Constant of reciprocal rank fusion, dampens the weight of the very top ranks
+RRF_K = 60
+
+
+def _passage_text(doc: Dict[str, Any]) -> str:
+    return f"{doc.get('title', '')}\n{doc.get('content', '')}"
+
+
+def _passage_hash(doc: Dict[str, Any]) -> str:
+    return hashlib.sha1(_passage_text(doc).encode("utf-8")).hexdigest()
+
+
+class Embedder:
+    """Small local embedding model running on the CPU"""
+
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL, batch_size: int = 64):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts: List[str]) -> "np.ndarray":
+        """Embed texts in batches into unit-length float32 vectors"""
+        vectors = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )
+        return vectors.astype(np.float32, copy=False)
+
+
+class VectorIndex:
+    """Passage embeddings aligned with the documents of a SearchIndex"""
+
+    def __init__(self, ids: List[str], hashes: List[str], vectors: "np.ndarray", model_name: str):
+        self.ids = ids
+        self.hashes = hashes
+        self.vectors = vectors
+        self.model_name = model_name
+
+    @classmethod
+    def build(
+        cls,
+        documents: List[Dict[str, Any]],
+        embedder: Embedder,
+        previous: Optional["VectorIndex"] = None
+    ) -> "VectorIndex":
+        """Embed the documents, reusing the vectors of passages that did not change"""
+        ids = [doc.get('id', doc['url']) for doc in documents]
+        hashes = [_passage_hash(doc) for doc in documents]
+
+        reusable = {}
+        if previous is not None and previous.model_name == embedder.model_name:
+            reusable = {
+                (passage_id, passage_hash): row
+                for row, (passage_id, passage_hash) in enumerate(zip(previous.ids, previous.hashes))
+            }
+
+        rows = [reusable.get(key) for key in zip(ids, hashes)]
+        missing = [i for i, row in enumerate(rows) if row is None]
+
+        dimension = embedder.model.get_sentence_embedding_dimension()
+        vectors = np.zeros((len(documents), dimension), dtype=np.float32)
+
+        reused = [i for i, row in enumerate(rows) if row is not None]
+        if reused:
+            vectors[reused] = previous.vectors[[rows[i] for i in reused]]
+        if missing:
+            print(f"Embedding {len(missing)} passages ({len(reused)} reused)...")
+            vectors[missing] = embedder.encode([_passage_text(documents[i]) for i in missing])
+
+        return cls(ids, hashes, vectors, embedder.model_name)
+
+    def matches(self, documents: List[Dict[str, Any]]) -> bool:
+        """Whether the vectors line up with these documents and embed their current text"""
+        return (
+            len(self.ids) == len(documents)
+            and all(
+                doc.get('id', doc['url']) == passage_id and _passage_hash(doc) == passage_hash
+                for doc, passage_id, passage_hash in zip(documents, self.ids, self.hashes)
+            )
+        )
+
+    def search(self, query_vectors: "np.ndarray", k: int) -> List[List[Tuple[int, float]]]:
+        """Top-k passages by cosine similarity for each of a batch of query vectors"""
+        if len(self.ids) == 0:
+            return [[] for _ in range(len(query_vectors))]
+
+        k = min(k, len(self.ids))
+        similarities = query_vectors @ self.vectors.T
+
+        # Partial selection of the top k, then sort only those
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            order = candidates[np.argsort(-similarities[row, candidates])]
+            results.append([(int(i), float(similarities[row, i])) for i in order])
+        return results
+
+    def save(self, directory: str = "data"):
+        """Persist the vectors next to the index file"""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "embeddings.tmp.npy"), self.vectors)
+        os.replace(os.path.join(directory, "embeddings.tmp.npy"), os.path.join(directory, "embeddings.npy"))
+
+        meta = {"model": self.model_name, "ids": self.ids, "hashes": self.hashes}
+        with open(os.path.join(directory, "embeddings.json.tmp"), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(os.path.join(directory, "embeddings.json.tmp"), os.path.join(directory, "embeddings.json"))
+
+    @classmethod
+    def load(cls, directory: str = "data") -> Optional["VectorIndex"]:
+        """Load persisted vectors, memory-mapped read-only"""
+        vectors_path = os.path.join(directory, "embeddings.npy")
+        meta_path = os.path.join(directory, "embeddings.json")
+        if not (os.path.exists(vectors_path) and os.path.exists(meta_path)):
+            return None
+
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        vectors = np.load(vectors_path, mmap_mode="r")
+        if len(vectors) != len(meta["ids"]):
+            return None
+        return cls(meta["ids"], meta["hashes"], vectors, meta["model"])
+
+
+def reciprocal_rank_fusion(rankings: List[Dict[int, float]], k: int = RRF_K) -> Dict[int, float]:
+    """Fuse several scored rankings by summing 1 / (k + rank) over them"""
+    fused: Dict[int, float] = {}
+    for scores in rankings:
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        for rank, (doc_id, _) in enumerate(ranked, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return fused